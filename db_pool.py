@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Sdílený pool pg8000 spojení pro vyhledávací kroky (4a, 4b)
+"""
+
+import pg8000
+import queue
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Optional
+
+# Maximální počet nečinných spojení drženého v poolu
+POOL_MAX_SIZE = 10
+
+class ConnectionPool:
+    """Jednoduchý pool pg8000 spojení - spojení se znovu používají místo nového připojení pro každý dotaz"""
+    
+    def __init__(self, connection_params: Dict[str, Any], max_size: int = POOL_MAX_SIZE,
+                 on_close: Optional[Callable[[Any], None]] = None):
+        self.connection_params = connection_params
+        self.max_size = max_size
+        self.idle = queue.LifoQueue()
+        # Volá se pro každé spojení, které pool zavírá (uvolnění dat navázaných na spojení)
+        self.on_close = on_close
+    
+    @contextmanager
+    def connection(self):
+        """Zapůjčí spojení z poolu (případně otevře nové) a po použití ho vrátí"""
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = pg8000.connect(**self.connection_params)
+        
+        try:
+            yield conn
+            # Nepotvrzenou (čtecí) transakci ukončíme, aby se spojení vracelo čisté
+            conn.rollback()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                # Rozbité spojení do poolu nevracíme
+                self._discard(conn)
+                raise
+            self._release(conn)
+            raise
+        else:
+            self._release(conn)
+    
+    def _release(self, conn):
+        if self.idle.qsize() < self.max_size:
+            self.idle.put(conn)
+        else:
+            self._discard(conn)
+    
+    def _discard(self, conn):
+        """Zavře spojení, které se do poolu už nevrátí"""
+        if self.on_close is not None:
+            self.on_close(conn)
+        try:
+            conn.close()
+        except Exception:
+            # Rozbité spojení nemusí jít zavřít korektně - stačí, že ho nikdo nepoužívá
+            pass
+    
+    def close(self):
+        """Uzavře všechna nečinná spojení"""
+        while True:
+            try:
+                self._discard(self.idle.get_nowait())
+            except queue.Empty:
+                break
@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+"""
+Společná část kroků 3 a 3b: text z SPC dokumentů, tabulky extrahovaných informací a zpracování léků
+Kroky se liší jen modelem, který z textu SPC extrahuje informace
+"""
+
+import pg8000
+import functools
+import itertools
+import json
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Callable
+import logging
+import pdfplumber
+import pypdfium2 as pdfium
+import zstandard as zstd
+from io import BytesIO
+
+# Nastavení logování
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Nadpis číslovaného oddílu SPC na začátku řádku, např. "4.1 Terapeutické indikace"
+SPC_SECTION_PATTERN = re.compile(r'^[ \t]*(\d{1,2}\.\d{1,2})\.?[ \t]+(?=[A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ])', re.MULTILINE)
+
+# Počet extrahovaných léků zapsaných do databáze jedním dotazem
+EXTRACTED_BATCH_SIZE = 500
+# Nové výsledky modelu i převzaté oddíly SPC do cache podle SHA-256 PDF (řádky z cache mají extracted_json prázdné)
+EXTRACTION_CACHE_INSERT_SQL = """
+    INSERT INTO extraction_cache (pdf_sha256, model, prompt_version, extracted_json, extracted_text)
+    SELECT pdf_sha256, %s, %s, extracted_json, extracted_text
+    FROM jsonb_to_recordset(%s::jsonb) AS t(pdf_sha256 VARCHAR(64), extracted_json JSONB, extracted_text TEXT)
+    WHERE pdf_sha256 IS NOT NULL AND extracted_json IS NOT NULL
+    ON CONFLICT DO NOTHING
+"""
+# Extrahované informace jsou jeden JSONB sloupec; pole čtená dalšími kroky (indikace, davkovani)
+# a fulltextový vektor se z něj dopočítávají jako generované sloupce. Funkce jsou IMMUTABLE obálky,
+# generovaný sloupec nesmí volat poddotaz ani STABLE funkce přímo
+EXTRACTED_INFO_TABLE_SQL = """
+    CREATE OR REPLACE FUNCTION jsonb_text_array(value JSONB) RETURNS TEXT[]
+    LANGUAGE sql IMMUTABLE AS $$
+        SELECT coalesce(array_agg(item), '{}') FROM jsonb_array_elements_text(coalesce(value, '[]')) AS item
+    $$;
+    CREATE OR REPLACE FUNCTION extracted_info_search_tsv(extracted JSONB) RETURNS tsvector
+    LANGUAGE sql IMMUTABLE AS $$
+        SELECT to_tsvector('simple', coalesce(extracted->'indikace', '[]'))
+            || to_tsvector('simple', coalesce(extracted->'ucinky', '[]'))
+            || to_tsvector('simple', coalesce(extracted->'skupina', '[]'))
+    $$;
+    CREATE TABLE IF NOT EXISTS extracted_info (
+        id SERIAL PRIMARY KEY,
+        kod_sukl VARCHAR(20) REFERENCES leciva(kod_sukl) UNIQUE,
+        extracted JSONB NOT NULL,
+        indikace TEXT[] GENERATED ALWAYS AS (jsonb_text_array(extracted->'indikace')) STORED,
+        davkovani TEXT[] GENERATED ALWAYS AS (jsonb_text_array(extracted->'davkovani')) STORED,
+        search_tsv tsvector GENERATED ALWAYS AS (extracted_info_search_tsv(extracted)) STORED,
+        extracted_text TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+# Převod starší tabulky s jedním TEXT[] sloupcem na pole - data se přesunou do extracted
+EXTRACTED_INFO_MIGRATION_SQL = """
+    ALTER TABLE extracted_info ADD COLUMN extracted JSONB;
+    UPDATE extracted_info o SET extracted = to_jsonb(o) - 'id' - 'kod_sukl' - 'extracted'
+        - 'extracted_text' - 'created_at' - 'search_tsv';
+    ALTER TABLE extracted_info ALTER COLUMN extracted SET NOT NULL;
+    ALTER TABLE extracted_info
+        DROP COLUMN IF EXISTS search_tsv,
+        DROP COLUMN IF EXISTS indikace,
+        DROP COLUMN IF EXISTS kontraindikace,
+        DROP COLUMN IF EXISTS ucinky,
+        DROP COLUMN IF EXISTS zpusob_podani,
+        DROP COLUMN IF EXISTS davkovani,
+        DROP COLUMN IF EXISTS nezadouci_ucinky,
+        DROP COLUMN IF EXISTS interakce,
+        DROP COLUMN IF EXISTS skupina,
+        DROP COLUMN IF EXISTS mechanismus;
+    ALTER TABLE extracted_info
+        ADD COLUMN indikace TEXT[] GENERATED ALWAYS AS (jsonb_text_array(extracted->'indikace')) STORED,
+        ADD COLUMN davkovani TEXT[] GENERATED ALWAYS AS (jsonb_text_array(extracted->'davkovani')) STORED,
+        ADD COLUMN search_tsv tsvector GENERATED ALWAYS AS (extracted_info_search_tsv(extracted)) STORED;
+    DROP FUNCTION IF EXISTS extracted_info_search_text(TEXT[], TEXT[], TEXT[])
+"""
+# Sloupce s dlouhými hodnotami komprimovanými lz4 (PostgreSQL 14+ sestavený s lz4)
+EXTRACTION_COMPRESSED_COLUMNS = (
+    ('extracted_info', 'extracted'),
+    ('extracted_info', 'extracted_text'),
+    ('extraction_cache', 'extracted_json'),
+    ('extraction_cache', 'extracted_text'),
+)
+# Sloupce, které lz4 ještě nemají - ALTER bere zámek ACCESS EXCLUSIVE, nastavuje se jen jednou
+EXTRACTION_COMPRESSION_PENDING_SQL = """
+    SELECT c.relname, a.attname
+    FROM pg_attribute a
+    JOIN pg_class c ON c.oid = a.attrelid
+    WHERE pg_table_is_visible(c.oid)
+      AND (c.relname, a.attname) IN (""" + ", ".join(
+    f"('{table}', '{column}')" for table, column in EXTRACTION_COMPRESSED_COLUMNS) + """)
+      AND a.attcompression IS DISTINCT FROM 'l'
+"""
+# Celá dávka jde jako jeden JSON parametr, jsonb_to_recordset z ní udělá řádky
+EXTRACTED_INFO_UPSERT_SQL = """
+    INSERT INTO extracted_info (kod_sukl, extracted, extracted_text)
+    SELECT kod_sukl, extracted, extracted_text
+    FROM jsonb_to_recordset(%s::jsonb) AS t(kod_sukl VARCHAR(20), extracted JSONB, extracted_text TEXT)
+    ON CONFLICT (kod_sukl) DO UPDATE SET
+        extracted = EXCLUDED.extracted,
+        extracted_text = EXCLUDED.extracted_text
+"""
+# Procesy pro extrakci textu z PDF - výchozí je jeden na každé jádro CPU
+PDF_WORKERS = os.cpu_count()
+
+# SPC dokumenty léků, které ještě nebyly zpracovány - čtou se serverovým kurzorem po SPC_FETCH_SIZE.
+# Pro PDF, které už model zpracoval (stejný SHA-256, model i verze promptu), se místo dat PDF vrátí
+# výsledek z cache - stejné SPC často sdílí více kódů SÚKL (různá balení)
+# Každý lék má právě jeden (nejnovější) SPC dokument - bez DISTINCT, který by řadil celá PDF.
+# LIMIT NULL znamená bez omezení
+PENDING_DOCUMENTS_DECLARE_SQL = """
+    DECLARE spc_stream NO SCROLL CURSOR FOR
+    SELECT l.kod_sukl, l.nazev, d.pdf_sha256,
+           CASE WHEN c.extracted_json IS NULL THEN d.pdf_data END AS pdf_data, d.pdf_encoding,
+           c.extracted_json, c.extracted_text
+    FROM leciva l
+    JOIN LATERAL (
+        SELECT pdf_data, pdf_encoding, pdf_sha256
+        FROM dokumenty
+        WHERE kod_sukl = l.kod_sukl AND typ = 'spc'
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) d ON true
+    LEFT JOIN extraction_cache c ON c.pdf_sha256 = d.pdf_sha256
+        AND c.model = %s AND c.prompt_version = %s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM extracted_info ei WHERE ei.kod_sukl = l.kod_sukl
+    )
+    LIMIT %s
+"""
+SPC_FETCH_SIZE = 16
+# Lokální cache textů z PDF - přežije i změnu promptu, kdy se musí znovu volat model
+TEXT_CACHE_PATH = "pdf_text.sqlite"
+TEXT_CACHE_MAX_ENTRIES = 20000
+PENDING_DOCUMENTS_FETCH_SQL = f"FETCH {SPC_FETCH_SIZE} FROM spc_stream"
+
+def decode_pdf_data(pdf_data: bytes, pdf_encoding: Optional[str]) -> bytes:
+    """Vrátí původní PDF z dat uložených v tabulce dokumenty"""
+    if pdf_encoding == 'zstd':
+        return zstd.ZstdDecompressor().decompress(pdf_data)
+    return pdf_data
+
+def extract_text_pdfium(pdf_content: bytes) -> str:
+    """Extrahuje text z PDF pomocí PDFium (nativní knihovna, jen textová vrstva bez analýzy layoutu)"""
+    pdf = pdfium.PdfDocument(pdf_content)
+    try:
+        parts = []
+        for page in pdf:
+            textpage = page.get_textpage()
+            parts.append(textpage.get_text_range())
+            # Nativní objekty uvolníme hned, ne až garbage collectorem
+            textpage.close()
+            page.close()
+        return "\n".join(parts)
+    finally:
+        pdf.close()
+
+def extract_text_pdfplumber(pdf_content: bytes) -> str:
+    """Extrahuje text z PDF pomocí pdfplumber (pomalejší, čistý Python)"""
+    with BytesIO(pdf_content) as pdf_file:
+        with pdfplumber.open(pdf_file) as pdf:
+            text = ""
+            for page in pdf.pages:
+                page_text = page.extract_text()
+                if page_text:
+                    text += page_text + "\n"
+            return text
+
+def pdf_to_text(pdf_data: bytes, pdf_encoding: Optional[str]) -> str:
+    """Extrahuje text z PDF uloženého v databázi (běží v samostatném procesu)"""
+    try:
+        pdf_content = decode_pdf_data(pdf_data, pdf_encoding)
+        text = extract_text_pdfium(pdf_content)
+        if not text.strip():
+            # PDFium nic nevrátilo (např. naskenované PDF) - zkusíme ještě pdfplumber
+            text = extract_text_pdfplumber(pdf_content)
+        
+        logger.info(f"Extrahováno {len(text)} znaků textu z PDF")
+        return text
+        
+    except Exception as e:
+        logger.error(f"Chyba při extrakci textu z PDF: {e}")
+        return ""
+
+def split_spc_sections(text: str) -> Dict[str, str]:
+    """Rozdělí text SPC na číslované oddíly (číslo oddílu -> text včetně nadpisu, platí první výskyt)"""
+    headers = list(SPC_SECTION_PATTERN.finditer(text))
+    sections = {}
+    for header, next_header in zip(headers, headers[1:] + [None]):
+        end = next_header.start() if next_header else len(text)
+        sections.setdefault(header.group(1), text[header.start():end].strip())
+    return sections
+
+def slice_spc_sections(text: str, sections: Tuple[str, ...], limit: int) -> str:
+    """Vrátí jen vybrané oddíly SPC, každý zkrácený na stejný díl z limitu"""
+    found = split_spc_sections(text)
+    share = limit // len(sections)
+    parts = [found[number][:share] for number in sections if number in found]
+    
+    # Dokument bez rozpoznaných oddílů pošleme jako dosud - prvních limit znaků
+    if not parts:
+        return text[:limit]
+    return "\n\n".join(parts)
+
+class TextCache:
+    """Lokální cache textů z PDF podle SHA-256 (sqlite) - opakované zpracování PDF znovu neparsuje"""
+    
+    def __init__(self, path: str = TEXT_CACHE_PATH, max_entries: int = TEXT_CACHE_MAX_ENTRIES):
+        self.conn = sqlite3.connect(path)
+        self.max_entries = max_entries
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pdf_text (
+                pdf_sha256 TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                used_at REAL NOT NULL
+            )
+        """)
+    
+    def get(self, pdf_sha256: Optional[str]) -> Optional[str]:
+        """Vrátí uložený text PDF, None pokud v cache není"""
+        if not pdf_sha256:
+            return None
+        row = self.conn.execute("SELECT text FROM pdf_text WHERE pdf_sha256 = ?", (pdf_sha256,)).fetchone()
+        return row[0] if row else None
+    
+    def put(self, pdf_sha256: Optional[str], text: str):
+        """Uloží text PDF (i při zásahu cache - obnoví čas posledního použití)"""
+        if pdf_sha256 and text:
+            self.conn.execute("INSERT OR REPLACE INTO pdf_text VALUES (?, ?, ?)", (pdf_sha256, text, time.time()))
+            self.conn.commit()
+    
+    def close(self):
+        """Zahodí nejdéle nepoužité texty nad max_entries a uzavře cache"""
+        self.conn.execute("""
+            DELETE FROM pdf_text WHERE pdf_sha256 NOT IN (
+                SELECT pdf_sha256 FROM pdf_text ORDER BY used_at DESC LIMIT ?
+            )
+        """, (self.max_entries,))
+        self.conn.commit()
+        self.conn.close()
+
+class ExtractionDatabase:
+    """Správce databáze pro ukládání extrahovaných informací jedním modelem"""
+    
+    def __init__(self, model: str, prompt_version: int, host: str = "localhost", port: int = 5432,
+                 database: str = "test", user: str = "test", password: str = "test"):
+        # Model a verze promptu určují, které výsledky z extraction_cache lze převzít
+        self.model = model
+        self.prompt_version = prompt_version
+        self.connection_params = {
+            'host': host,
+            'port': port,
+            'database': database,
+            'user': user,
+            'password': password
+        }
+        # Jediné místo, kde se otevírají spojení - parametry se navážou jen jednou
+        self.connection_factory = functools.partial(pg8000.connect, **self.connection_params)
+        # Jedno spojení na celý běh - bez nového TCP spojení a přihlášení pro každý dotaz
+        logger.info("Připojuji k databázi...")
+        self.conn = self.connection_factory()
+        self.init_extraction_tables()
+    
+    def commit(self):
+        """Potvrdí transakci na sdíleném spojení"""
+        self.conn.commit()
+    
+    def rollback(self):
+        """Zruší rozpracovanou transakci na sdíleném spojení"""
+        self.conn.rollback()
+    
+    def close(self):
+        """Uzavře databázové spojení"""
+        self.conn.close()
+    
+    def init_extraction_tables(self):
+        """Vytvoří tabulky pro extrahované informace"""
+        try:
+            logger.info("Vytvářím tabulky...")
+            with self.conn.cursor() as cursor:
+                
+                # Tabulka pro extrahované informace
+                logger.info("Vytvářím tabulku extracted_info...")
+                cursor.execute(EXTRACTED_INFO_TABLE_SQL)
+                cursor.execute("""
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'extracted_info' AND column_name = 'extracted'
+                """)
+                if not cursor.fetchall():
+                    logger.info("Převádím tabulku extracted_info na JSONB...")
+                    cursor.execute(EXTRACTED_INFO_MIGRATION_SQL)
+                # ON CONFLICT (kod_sukl) při ukládání potřebuje unikátní index
+                cursor.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS extracted_info_kod_sukl_key
+                    ON extracted_info (kod_sukl)
+                """)
+                # Fulltext nad indikacemi, účinky a skupinou a dotazy typu extracted @> '{...}'
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS extracted_info_search_tsv_idx
+                    ON extracted_info USING gin (search_tsv)
+                """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS extracted_info_extracted_idx
+                    ON extracted_info USING gin (extracted jsonb_path_ops)
+                """)
+                logger.info("Tabulka extracted_info vytvořena")
+                
+                # Cache výsledků modelu podle obsahu PDF
+                logger.info("Vytvářím tabulku extraction_cache...")
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS extraction_cache (
+                        pdf_sha256 VARCHAR(64),
+                        model VARCHAR(100),
+                        prompt_version INTEGER,
+                        extracted_json JSONB NOT NULL,
+                        extracted_text TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (pdf_sha256, model, prompt_version)
+                    )
+                """)
+                logger.info("Tabulka extraction_cache vytvořena")
+                
+                # Tabulka pro vyhledávání
+                logger.info("Vytvářím tabulku search_index...")
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS search_index (
+                        id SERIAL PRIMARY KEY,
+                        kod_sukl VARCHAR(20) REFERENCES leciva(kod_sukl),
+                        klicove_slovo VARCHAR(100),
+                        typ_informace VARCHAR(50),
+                        relevance INTEGER DEFAULT 1,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                logger.info("Tabulka search_index vytvořena")
+                
+                self.commit()
+                logger.info("Tabulky pro extrakci inicializovány")
+            
+        except Exception as e:
+            logger.error(f"Chyba při inicializaci tabulek pro extrakci: {e}")
+            raise
+        
+        self.set_lz4_compression()
+    
+    def set_lz4_compression(self):
+        """Nastaví lz4 kompresi dlouhých sloupců, pokud ji server podporuje (jinak zůstane pglz)"""
+        # Dlouhé hodnoty (TOAST) komprimuje lz4 místo výchozího pglz - rychlejší zápis i čtení.
+        # Platí pro nově zapsané hodnoty, starší přepíše VACUUM FULL
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute("SELECT current_setting('server_version_num')::int")
+                if cursor.fetchone()[0] < 140000:
+                    logger.info("PostgreSQL starší než 14 - lz4 komprese se nenastavuje")
+                    return
+                
+                cursor.execute(EXTRACTION_COMPRESSION_PENDING_SQL)
+                for table, column in cursor.fetchall():
+                    cursor.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET COMPRESSION lz4")
+                self.commit()
+            
+        except Exception as e:
+            # Např. server sestavený bez lz4 - extrakce funguje i s výchozí kompresí
+            self.rollback()
+            logger.warning(f"Nepodařilo se nastavit lz4 kompresi: {e}")
+    
+    def iter_pending_documents(self, limit: Optional[int] = None) -> Iterator[Tuple]:
+        """Postupně vrací SPC dokumenty nezpracovaných léků
+        (kod_sukl, nazev, pdf_sha256, pdf_data, pdf_encoding, extracted_json, extracted_text)"""
+        # Kurzor běží na vlastním spojení - hlavní spojení mezitím zapisuje a potvrzuje dávky,
+        # commit by kurzor bez WITH HOLD zavřel. V paměti je vždy jen jedna načtená dávka PDF
+        with self.connection_factory() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(PENDING_DOCUMENTS_DECLARE_SQL, (self.model, self.prompt_version, limit))
+                while True:
+                    cursor.execute(PENDING_DOCUMENTS_FETCH_SQL)
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    yield from rows
+    
+    def save_extracted_info_batch(self, rows: List[Dict[str, Any]]) -> int:
+        """Uloží dávku extrahovaných informací jedním dotazem, vrátí počet uložených léků"""
+        if not rows:
+            return 0
+        try:
+            with self.conn.cursor() as cursor:
+                rows_json = json.dumps(rows, ensure_ascii=False)
+                cursor.execute(EXTRACTED_INFO_UPSERT_SQL, (rows_json,))
+                cursor.execute(EXTRACTION_CACHE_INSERT_SQL, (self.model, self.prompt_version, rows_json))
+                self.commit()
+                logger.info(f"💾 Uloženo {len(rows)} léků do databáze")
+                return len(rows)
+            
+        except Exception as e:
+            self.rollback()
+            logger.error(f"Chyba při ukládání dávky {len(rows)} extrahovaných informací: {e}")
+            return 0
+
+def as_text_list(value: Any) -> List[str]:
+    """Převede hodnotu z odpovědi modelu na seznam řetězců"""
+    if isinstance(value, list):
+        return [str(item) for item in value if item]
+    if value:
+        return [str(value)]
+    return []
+
+def extracted_info_row(fields: Tuple[Tuple[str, str], ...], kod_sukl: str, extracted_info: Dict[str, Any],
+                       extracted_text: str) -> Dict[str, Any]:
+    """Sestaví řádek tabulky extracted_info z odpovědi modelu (fields: sloupec v extracted, klíč odpovědi)"""
+    return {
+        'kod_sukl': kod_sukl,
+        'extracted': {column: as_text_list(extracted_info.get(key)) for column, key in fields},
+        # Omezíme délku uloženého textu, znak NUL PostgreSQL v textu nepřijme
+        'extracted_text': extracted_text[:1000].replace('\x00', ''),
+    }
+
+def cacheable_row(fields: Tuple[Tuple[str, str], ...], kod_sukl: str, pdf_sha256: Optional[str],
+                  extracted_info: Dict[str, Any], extracted_text: str) -> Dict[str, Any]:
+    """Sestaví řádek extracted_info, který se uloží i do extraction_cache"""
+    row = extracted_info_row(fields, kod_sukl, extracted_info, extracted_text)
+    # Výsledek se uloží i do cache, další lék se stejným PDF ho použije
+    row['pdf_sha256'] = pdf_sha256
+    row['extracted_json'] = extracted_info
+    return row
+
+def process_medicine(extractor, fields: Tuple[Tuple[str, str], ...], kod_sukl: str, nazev: str,
+                     pdf_sha256: Optional[str], text: str, index: int) -> Optional[Dict[str, Any]]:
+    """Extrahuje informace o jednom léku z textu jeho SPC (běží ve vlákně), vrátí řádek k uložení"""
+    logger.info(f"Zpracovávám {index}: {kod_sukl} - {nazev}")
+    
+    try:
+        # 1. Text z PDF připravil proces pro extrakci textu
+        if not text:
+            logger.warning(f"Prázdný text pro {kod_sukl}")
+            return None
+        
+        # 2. Extrakce informací modelem
+        extracted_info = extractor.extract_medicine_info(text, kod_sukl)
+        if not extracted_info:
+            logger.warning(f"Prázdné extrahované informace pro {kod_sukl}")
+            return None
+        
+        # 3. Řádek pro uložení - do databáze se zapisuje po dávkách
+        logger.info(f"✅ Informace extrahovány pro {kod_sukl}")
+        return cacheable_row(fields, kod_sukl, pdf_sha256, extracted_info, text)
+        
+    except Exception as e:
+        logger.error(f"Chyba při zpracování {kod_sukl}: {e}")
+        return None
+
+def extract_pending_medicines(extractor, db_manager: ExtractionDatabase, fields: Tuple[Tuple[str, str], ...],
+                              llm_workers: int, limit: Optional[int] = None,
+                              deterministic_extract: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None
+                              ) -> Dict[str, int]:
+    """Zpracuje SPC dokumenty nezpracovaných léků a uloží výsledky, vrátí počty zpracovaných léků"""
+    # Text z PDF se extrahuje paralelně v procesech (pdfplumber je čistý Python a vytíží
+    # jen jedno jádro); každý hotový text jde hned dál k modelu, obě fáze se tak překrývají
+    # Z kurzoru se dočítají další PDF jen tehdy, když je rozpracováno méně než medicines_in_flight
+    # léků (PDF v paměti, text čekající na model) - paměť tak zůstává stejná bez ohledu na počet dokumentů
+    medicines_in_flight = 2 * (PDF_WORKERS + llm_workers)
+    counts = {'medicines': 0, 'cached': 0, 'deterministic': 0, 'saved': 0}
+    batch = {}
+    text_cache = TextCache()
+    try:
+        documents = db_manager.iter_pending_documents(limit)
+        with ProcessPoolExecutor(max_workers=PDF_WORKERS) as pdf_executor, \
+                ThreadPoolExecutor(max_workers=llm_workers) as llm_executor:
+            pdf_futures = {}
+            llm_futures = set()
+            while True:
+                free_slots = medicines_in_flight - len(pdf_futures) - len(llm_futures)
+                fetched = 0
+                for (kod_sukl, nazev, pdf_sha256, pdf_data, pdf_encoding,
+                     cached_json, cached_text) in itertools.islice(documents, free_slots):
+                    fetched += 1
+                    if cached_json is not None:
+                        # Stejné PDF už bylo zpracováno - bez extrakce textu i volání modelu
+                        counts['medicines'] += 1
+                        counts['cached'] += 1
+                        logger.info(f"♻️ Informace pro {kod_sukl} převzaty z cache")
+                        batch[kod_sukl] = extracted_info_row(fields, kod_sukl, cached_json, cached_text or "")
+                        continue
+                    text = text_cache.get(pdf_sha256)
+                    if text is None:
+                        text_future = pdf_executor.submit(pdf_to_text, pdf_data, pdf_encoding)
+                    else:
+                        # Text tohoto PDF už známe - hotový výsledek projde stejnou cestou jako z procesu
+                        text_future = Future()
+                        text_future.set_result(text)
+                    pdf_futures[text_future] = (kod_sukl, nazev, pdf_sha256)
+                if not fetched and not pdf_futures and not llm_futures:
+                    break
+                
+                done, _ = wait([*pdf_futures, *llm_futures], return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in pdf_futures:
+                        kod_sukl, nazev, pdf_sha256 = pdf_futures.pop(future)
+                        counts['medicines'] += 1
+                        text = future.result()
+                        text_cache.put(pdf_sha256, text)
+                        deterministic_info = deterministic_extract(text) if deterministic_extract and text else None
+                        if deterministic_info:
+                            # Oddíly jdou převzít přímo z SPC - model není potřeba. Výsledek jde do cache
+                            # stejně jako odpověď modelu, PDF se při dalším běhu ani neparsuje
+                            counts['deterministic'] += 1
+                            logger.info(f"📑 Oddíly pro {kod_sukl} převzaty přímo z SPC")
+                            batch[kod_sukl] = cacheable_row(fields, kod_sukl, pdf_sha256, deterministic_info, text)
+                            continue
+                        
+                        # Ostatní texty jdou hned k modelu
+                        llm_futures.add(llm_executor.submit(process_medicine, extractor, fields, kod_sukl, nazev,
+                                                            pdf_sha256, text, counts['medicines']))
+                        continue
+                    
+                    llm_futures.remove(future)
+                    row = future.result()
+                    if row:
+                        # Dávka je podle kódu SÚKL - upsert nesmí v jednom dotazu měnit stejný řádek dvakrát
+                        batch[row['kod_sukl']] = row
+                
+                # Výsledky se zapisují po EXTRACTED_BATCH_SIZE lécích jedním dotazem
+                if len(batch) >= EXTRACTED_BATCH_SIZE:
+                    counts['saved'] += db_manager.save_extracted_info_batch(list(batch.values()))
+                    batch = {}
+        counts['saved'] += db_manager.save_extracted_info_batch(list(batch.values()))
+    finally:
+        text_cache.close()
+    return counts
@@ -12,11 +12,14 @@ class OllamaClient:
     
     def __init__(self, base_url: str = "http://localhost:11434"):
         self.base_url = base_url
+        # Jedna session = keep-alive spojení, bez nového TCP handshake pro každý požadavek
+        self.session = requests.Session()
+        self.session.headers['Connection'] = 'keep-alive'
     
     def list_models(self) -> List[Dict[str, Any]]:
         """Vrátí seznam dostupných modelů"""
         try:
-            response = requests.get(f"{self.base_url}/api/tags")
+            response = self.session.get(f"{self.base_url}/api/tags")
             if response.status_code == 200:
                 data = response.json()
                 return data.get('models', [])
@@ -28,30 +31,40 @@ class OllamaClient:
             return []
     
     def generate_text(self, model: str, prompt: str, system: str = None) -> str:
-        """Vygeneruje text pomocí zadaného modelu"""
+        """Vygeneruje text pomocí zadaného modelu (odpověď čte průběžně po tokenech)"""
         payload = {
             "model": model,
             "prompt": prompt,
-            "stream": False
+            "stream": True
         }
         
         if system:
             payload["system"] = system
         
         try:
-            # Kratší timeout pro rychlejší testy
-            response = requests.post(
+            # Oddělené timeouty: 5 s na spojení, 120 s mezi dvěma částmi odpovědi -
+            # dlouhá, ale průběžně generovaná odpověď tak nevyprší
+            with self.session.post(
                 f"{self.base_url}/api/generate",
                 json=payload,
-                timeout=30  # 30 sekund místo 60
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('response', '')
-            else:
-                print(f"Chyba při generování: {response.status_code}")
-                return ""
+                stream=True,
+                timeout=(5, 120)
+            ) as response:
+                
+                if response.status_code != 200:
+                    print(f"Chyba při generování: {response.status_code}")
+                    return ""
+                
+                # Každý řádek je jeden JSON objekt s částí odpovědi, poslední má done=true
+                parts = []
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    parts.append(chunk.get('response', ''))
+                    if chunk.get('done'):
+                        break
+                return ''.join(parts)
                 
         except requests.exceptions.Timeout:
             print(f"❌ Timeout - model {model} je příliš pomalý")
@@ -60,10 +73,23 @@ class OllamaClient:
             print(f"Chyba při komunikaci s modelem: {e}")
             return ""
     
+    def warmup_model(self, model: str) -> bool:
+        """Načte model do paměti (prázdný prompt nic negeneruje)"""
+        try:
+            response = self.session.post(
+                f"{self.base_url}/api/generate",
+                json={"model": model, "prompt": "", "stream": False},
+                timeout=120
+            )
+            return response.status_code == 200
+        except Exception as e:
+            print(f"Chyba při načítání modelu {model}: {e}")
+            return False
+    
     def test_connection(self) -> bool:
         """Otestuje připojení k Ollama"""
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=5)
             return response.status_code == 200
         except:
             return False
@@ -106,15 +132,18 @@ def main():
     
     # Vybereme nejmenší dostupný model
     if models:
-        # Seřadíme modely podle velikosti (předpokládáme, že menší = rychlejší)
-        models.sort(key=lambda x: x.get('size', float('inf')))
-        model_name = models[0]['name']
+        # Vybereme model s nejmenší velikostí (předpokládáme, že menší = rychlejší)
+        model_name = min(models, key=lambda x: x.get('size', float('inf')))['name']
         print(f"   Používám nejmenší model: {model_name}")
         
+        # Načtení modelu předem, aby se do timeoutu generování nepočítalo jeho nahrání
+        print("   ⏳ Načítám model do paměti...")
+        client.warmup_model(model_name)
+        
         # Krátký test
         prompt = "Ahoj, jak se máš?"
         print(f"   Prompt: {prompt}")
-        print("   ⏳ Čekám na odpověď (max 30 sekund)...")
+        print("   ⏳ Čekám na odpověď...")
         
         response = client.generate_text(model_name, prompt)
         if response:
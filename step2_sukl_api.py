@@ -4,45 +4,454 @@ Krok 2: Stahování dat z SÚKL API a ukládání do PostgreSQL
 """
 
 import requests
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.connection import HTTPConnection
 import pg8000
-import json
+import functools
+import hashlib
+import zstandard as zstd
+import orjson
+import os
+import re
+import socket
 import time
-from typing import List, Dict, Any
+import random
+import threading
+import queue
+import tempfile
+import struct
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from typing import List, Dict, Any, Optional
 import logging
 
 # Nastavení logování
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Původní sloupce tabulky leciva a jim odpovídající JSON klíče detailu léku -
+# potřeba jen pro převod starých řádků do sloupce data (migrace 6)
+LEGACY_MEDICINE_COLUMNS = (
+    ('kod_sukl', 'kodSUKL'), ('nazev', 'nazev'), ('sila', 'sila'),
+    ('lekova_forma', 'lekovaFormaKod'), ('baleni', 'baleni'), ('cesta', 'cestaKod'),
+    ('doplnek', 'doplnek'), ('obal', 'obalKod'), ('drzitel', 'drzitelKod'),
+    ('zeme_drzitele', 'zemeDrziteleKod'), ('stav_registrace', 'stavRegistraceKod'),
+    ('atc_kod', 'ATCkod'), ('registracni_cislo', 'registracniCislo'),
+    ('ddd_mnozstvi', 'dddMnozstvi'), ('ddd_jednotka', 'dddMnozstviJednotka'),
+    ('ddd_baleni', 'dddBaleni'), ('zpusob_vydeje', 'zpusobVydejeKod'),
+    ('expirace', 'expirace'), ('expirace_jednotka', 'expiraceJednotka'),
+    ('registrovany_nazev', 'registrovanyNazevLP'), ('ochranne_prvky', 'ochrannePrvky'),
+    ('jazyk_obalu', 'jazykObalu'), ('datum_registrace', 'datumRegistrace')
+)
+
+# Počet léků odesílaných do databáze v jednom INSERT příkazu
+MEDICINE_BATCH_SIZE = 1000
+# UPSERT léků připravený na serveru (conn.prepare - EXECUTE jako SQL příkaz parametry
+# přijmout neumí) - každý sloupec jde jako jedno pole, takže funguje pro libovolnou
+# velikost dávky; detail léku jde jako JSON text, na JSONB ho převede server
+MEDICINE_UPSERT_SQL = """
+    INSERT INTO leciva (kod_sukl, nazev, data)
+    SELECT kod_sukl, nazev, data::jsonb
+    FROM unnest(:kod_sukl::text[], :nazev::text[], :data::text[]) AS t(kod_sukl, nazev, data)
+    ON CONFLICT (kod_sukl) DO UPDATE SET
+        nazev = EXCLUDED.nazev,
+        data = EXCLUDED.data
+"""
+# Sloupce dokumentů v pořadí, v jakém je posílá COPY
+DOCUMENT_COLUMNS = "kod_sukl, dokument_id, typ, nazev, pdf_data, pdf_size, pdf_sha256, pdf_encoding, etag"
+DOCUMENT_STAGE_TRUNCATE_SQL = "TRUNCATE dokumenty_stage"
+DOCUMENT_COPY_SQL = f"COPY dokumenty_stage ({DOCUMENT_COLUMNS}) FROM STDIN WITH (FORMAT BINARY)"
+# Sloučení staging tabulky do dokumentů - SQL bez parametrů by se jinak posílalo
+# jednoduchým protokolem a parsovalo při každé dávce znovu, proto je připravené
+DOCUMENT_PREPARE_SQL = f"""
+    PREPARE dokumenty_merge AS
+    INSERT INTO dokumenty ({DOCUMENT_COLUMNS})
+    SELECT {DOCUMENT_COLUMNS} FROM dokumenty_stage
+    ON CONFLICT (kod_sukl, dokument_id) DO UPDATE SET
+        typ = EXCLUDED.typ,
+        nazev = EXCLUDED.nazev,
+        pdf_data = EXCLUDED.pdf_data,
+        pdf_size = EXCLUDED.pdf_size,
+        pdf_sha256 = EXCLUDED.pdf_sha256,
+        pdf_encoding = EXCLUDED.pdf_encoding,
+        etag = EXCLUDED.etag
+    WHERE (dokumenty.pdf_sha256, dokumenty.etag)
+        IS DISTINCT FROM (EXCLUDED.pdf_sha256, EXCLUDED.etag)
+"""
+DOCUMENT_EXECUTE_SQL = "EXECUTE dokumenty_merge"
+# Hromadné načtení (bez unikátního indexu): oba příkazy jdou bez parametrů jedním dotazem
+DOCUMENT_BULK_MERGE_SQL = f"""
+    DELETE FROM dokumenty d USING dokumenty_stage s
+    WHERE d.kod_sukl = s.kod_sukl AND d.dokument_id = s.dokument_id;
+    INSERT INTO dokumenty ({DOCUMENT_COLUMNS})
+    SELECT {DOCUMENT_COLUMNS} FROM dokumenty_stage
+"""
+# Data pro COPY se nad tuto velikost odkládají z paměti na disk
+COPY_SPOOL_SIZE = 8 * 1024 * 1024
+# PDF dokumenty jsou objemné - dávka je omezena počtem i celkovou velikostí
+DOCUMENT_BATCH_SIZE = 200
+DOCUMENT_BATCH_BYTES = 64 * 1024 * 1024
+# PDF se ukládají komprimovaná zstd (pdf_size je velikost původního PDF)
+PDF_ENCODING = 'zstd'
+PDF_COMPRESSOR = zstd.ZstdCompressor(level=3)
+# Velikost části při streamovaném stahování PDF
+PDF_CHUNK_SIZE = 64 * 1024
+# Větší PDF se nestahují (ochrana paměti před chybnou nebo obří odpovědí)
+MAX_PDF_SIZE = 50 * 1024 * 1024
+# Od tohoto počtu stahovaných léků se dokumenty načítají bez omezení tabulky
+BULK_LOAD_THRESHOLD = 5000
+# Omezení tabulky dokumenty, která hromadné načtení odstraní (název, definice) - unikátní index
+# se vytváří před cizím klíčem
+DOCUMENT_CONSTRAINTS = (
+    ('dokumenty_kod_sukl_dokument_id_key', 'UNIQUE (kod_sukl, dokument_id)'),
+    ('dokumenty_kod_sukl_fkey', 'FOREIGN KEY (kod_sukl) REFERENCES leciva(kod_sukl)'),
+)
+# Nejdelší doba, po kterou zapisovací vlákno drží neúplnou dávku (s)
+WRITER_FLUSH_INTERVAL = 5.0
+# Počet souběžně zpracovávaných léků (detail + SPC dokument)
+FETCH_WORKERS = 16
+# Po kolika zpracovaných lécích se vypíše průběh
+PROGRESS_LOG_INTERVAL = 100
+# Okno (s), ze kterého se počítá podíl odpovědí 429 pro adaptivní backoff
+THROTTLE_WINDOW = 60.0
+# TCP keepalive - nečinná keep-alive spojení v poolu nezavře NAT/firewall a odpadne nový TLS handshake
+KEEPALIVE_SOCKET_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+if hasattr(socket, 'TCP_KEEPIDLE'):  # Linux; na Windows/macOS zůstávají výchozí časy systému
+    KEEPALIVE_SOCKET_OPTIONS += [
+        (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 15),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 4),
+    ]
+
+# Konfigurace
+SKIP_EU_REGISTRATIONS = True  # Nastavte na False pokud chcete stahovat i EU registrace
+SKIP_STORED_DOCUMENTS = True  # Nastavte na False pokud chcete u uložených PDF kontrolovat změny (HEAD)
+
+# ATC kódy pro léky s rozmanitými indikacemi
+INTERESTING_ATC_CODES = [
+    'N02B',  # Analgetika (Paralen, Ibalgin)
+    'J01C',  # Beta-laktamová antibiotika (peniciliny)
+    'J01D',  # Cefalosporiny
+    'J01F',  # Makrolidy (azitromycin)
+    'J01M',  # Chinolony
+    'N05B',  # Anxiolytika (diazepam)
+    'N05C',  # Hypnotika a sedativa
+    'N06A',  # Antidepresiva
+    'A02B',  # Antacida a antiulcerózní léky
+    'C03',   # Diuretika
+    'C07',   # Beta-blokátory
+    'C08',   # Blokátory kalciových kanálů
+    'C09',   # ACE inhibitory a sartany
+    'M01A',  # Nesteroidní antirevmatika
+    'R06A',  # Antihistaminika (Kynedryl)
+    'R05',   # Antitusika a expektorancia
+    'A03',   # Spasmolytika
+    'A06',   # Laxativa
+    'A07',   # Antidiarrhoika
+    'D01',   # Antimykotika
+    'D06',   # Antibiotika a chemoterapeutika pro lokální použití
+    'G01',   # Gynekologická antimikrobiální látka
+    'H02',   # Kortikosteroidy pro systémové použití
+    'H03',   # Thyroidální hormony
+    'L01',   # Cytostatika
+    'P01',   # Antiprotozoální látky
+    'S01',   # Oftalmologické přípravky
+    'S02',   # Otologické přípravky
+]
+
+# Klíčová slova kontrastních látek a diagnostických přípravků, které přeskakujeme
+SKIP_KEYWORDS = ['iomeron', 'omnipaque', 'ultravist', 'iopamiro', 'iopromid', 
+                 'gadolinium', 'gadovist', 'dotarem', 'primovist', 'magnevist',
+                 'kontrast', 'kontrastní', 'diagnostický', 'diagnostika']
+
+# Předkompilované filtry - jedno volání v C místo smyčky v Pythonu pro každý lék
+INTERESTING_ATC_PREFIXES = tuple(INTERESTING_ATC_CODES)
+SKIP_KEYWORDS_PATTERN = re.compile('|'.join(map(re.escape, SKIP_KEYWORDS)), re.IGNORECASE)
+
+# Smazání všech tabulek kroku 2 (pouze pro testování, viz SUKL_RESET_DB)
+DROP_TABLES_SQL = """
+    DROP TABLE IF EXISTS dokumenty_stage;
+    DROP TABLE IF EXISTS dokumenty CASCADE;
+    DROP TABLE IF EXISTS leciva CASCADE;
+    DROP TABLE IF EXISTS schema_version
+"""
+
+# Migrace schématu databáze - verze odpovídá pořadí v seznamu (od 1)
+SCHEMA_MIGRATIONS = [
+    # 1: tabulky léků a dokumentů
+    [
+        # Tabulka léků - vše jako string pro testování
+        """
+        CREATE TABLE IF NOT EXISTS leciva (
+            kod_sukl VARCHAR(20) PRIMARY KEY,
+            nazev VARCHAR(500),
+            sila VARCHAR(100),
+            lekova_forma VARCHAR(100),
+            baleni VARCHAR(50),
+            cesta VARCHAR(50),
+            doplnek TEXT,
+            obal VARCHAR(50),
+            drzitel VARCHAR(100),
+            zeme_drzitele VARCHAR(50),
+            stav_registrace VARCHAR(10),
+            atc_kod VARCHAR(20),
+            registracni_cislo VARCHAR(100),
+            ddd_mnozstvi VARCHAR(20),
+            ddd_jednotka VARCHAR(10),
+            ddd_baleni VARCHAR(20),
+            zpusob_vydeje VARCHAR(10),
+            expirace VARCHAR(20),
+            expirace_jednotka VARCHAR(10),
+            registrovany_nazev VARCHAR(500),
+            ochranne_prvky VARCHAR(10),
+            jazyk_obalu VARCHAR(10),
+            datum_registrace VARCHAR(20),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Tabulka dokumentů
+        """
+        CREATE TABLE IF NOT EXISTS dokumenty (
+            id SERIAL PRIMARY KEY,
+            kod_sukl VARCHAR(20) REFERENCES leciva(kod_sukl),
+            dokument_id VARCHAR(20),
+            typ VARCHAR(50),
+            nazev VARCHAR(500),
+            pdf_data BYTEA,
+            pdf_size INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(kod_sukl, dokument_id)
+        )
+        """,
+    ],
+    # 2: otisk PDF pro přeskakování nezměněných dokumentů
+    [
+        "ALTER TABLE dokumenty ADD COLUMN IF NOT EXISTS pdf_sha256 CHAR(64)",
+    ],
+    # 3: komprese PDF (NULL = nekomprimovaná data) a index pro vyhledávání podle otisku
+    [
+        "ALTER TABLE dokumenty ADD COLUMN IF NOT EXISTS pdf_encoding VARCHAR(10)",
+        "CREATE INDEX IF NOT EXISTS idx_dokumenty_pdf_sha256 ON dokumenty (pdf_sha256)",
+    ],
+    # 4: UNLOGGED staging tabulka pro COPY dokumentů (nezapisuje se do WAL)
+    # Tabulka dokumenty se podle typu nedělí (PARTITION BY LIST): stahují se jen SPC, vznikl by jediný
+    # oddíl, a unikátní klíč (kod_sukl, dokument_id) pro ON CONFLICT by musel navíc obsahovat typ
+    [
+        """
+        CREATE UNLOGGED TABLE IF NOT EXISTS dokumenty_stage (
+            kod_sukl VARCHAR(20),
+            dokument_id VARCHAR(20),
+            typ VARCHAR(50),
+            nazev VARCHAR(500),
+            pdf_data BYTEA,
+            pdf_size INTEGER,
+            pdf_sha256 CHAR(64),
+            pdf_encoding VARCHAR(10)
+        )
+        """,
+    ],
+    # 5: verze PDF ze serveru (ETag, případně Last-Modified) pro HEAD kontrolu před stažením
+    [
+        "ALTER TABLE dokumenty ADD COLUMN IF NOT EXISTS etag VARCHAR(100)",
+        "ALTER TABLE dokumenty_stage ADD COLUMN IF NOT EXISTS etag VARCHAR(100)",
+    ],
+    # 6: celý detail léku jako JSONB místo 21 samostatných sloupců (nazev zůstává kvůli vyhledávání)
+    [
+        "ALTER TABLE leciva ADD COLUMN IF NOT EXISTS data JSONB",
+        "UPDATE leciva SET data = jsonb_build_object("
+        + ", ".join(f"'{key}', {column}" for column, key in LEGACY_MEDICINE_COLUMNS)
+        + ") WHERE data IS NULL",
+        "ALTER TABLE leciva "
+        + ", ".join(f"DROP COLUMN IF EXISTS {column}" for column, _ in LEGACY_MEDICINE_COLUMNS
+                    if column not in ('kod_sukl', 'nazev')),
+    ],
+]
+
+# Binární formát COPY: hlavička (signatura, příznaky, délka rozšíření) a konec dat
+COPY_BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+COPY_BINARY_TRAILER = struct.pack("!h", -1)
+COPY_INT16 = struct.Struct("!h")
+COPY_INT32 = struct.Struct("!i")
+
+def write_copy_binary_row(stream, row: tuple):
+    """Zapíše řádek v binárním formátu COPY (počet polí, pak délka a data každého pole)"""
+    stream.write(COPY_INT16.pack(len(row)))
+    for value in row:
+        if value is None:
+            stream.write(COPY_INT32.pack(-1))
+        elif isinstance(value, int):
+            # INTEGER sloupec = 4 bajty big-endian
+            stream.write(COPY_INT32.pack(4))
+            stream.write(COPY_INT32.pack(value))
+        else:
+            # BYTEA jde jako surové bajty bez hex/escape kódování, text jako UTF-8
+            data = value if isinstance(value, (bytes, bytearray)) else str(value).encode('utf-8')
+            stream.write(COPY_INT32.pack(len(data)))
+            stream.write(data)
+
+class RateLimiter:
+    """Token bucket omezující počet požadavků za časové okno (sdílený mezi vlákny)"""
+    
+    def __init__(self, max_rate: float = 10, time_period: float = 1.0):
+        self.capacity = max_rate
+        self.rate = max_rate / time_period
+        self.tokens = max_rate
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Počká, dokud není k dispozici token pro další požadavek"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+class ThrottleStats:
+    """Klouzavé okno odpovědí serveru - podíl 429 (Too Many Requests) za poslední dobu"""
+    
+    def __init__(self, window: float = THROTTLE_WINDOW):
+        self.window = window
+        self.responses = deque()
+        self.lock = threading.Lock()
+    
+    def record(self, throttled: bool):
+        """Zaznamená odpověď (throttled = server vrátil 429)"""
+        now = time.monotonic()
+        with self.lock:
+            self.responses.append((now, throttled))
+            while self.responses[0][0] < now - self.window:
+                self.responses.popleft()
+    
+    def throttle_ratio(self) -> float:
+        """Podíl odpovědí 429 v okně"""
+        with self.lock:
+            if not self.responses:
+                return 0.0
+            return sum(throttled for _, throttled in self.responses) / len(self.responses)
+
+class AdaptiveRetry(Retry):
+    """Retry, jehož čekání neroste s číslem pokusu, ale s četností 429 v poslední době"""
+    
+    def __init__(self, *args, throttle_stats: ThrottleStats = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.throttle_stats = throttle_stats
+    
+    def new(self, **kwargs):
+        # urllib3 vytváří pro každý pokus novou instanci - statistiky předáme dál
+        retry = super().new(**kwargs)
+        retry.throttle_stats = self.throttle_stats
+        return retry
+    
+    def increment(self, method=None, url=None, response=None, *args, **kwargs):
+        if self.throttle_stats is not None and response is not None and response.status == 429:
+            self.throttle_stats.record(True)
+        return super().increment(method, url, response, *args, **kwargs)
+    
+    def get_backoff_time(self) -> float:
+        if self.throttle_stats is None or not self.history:
+            return super().get_backoff_time()
+        # Čím víc 429 server vrací, tím déle čekáme; náhodný rozptyl rozhodí souběžná vlákna
+        throttle_ratio = self.throttle_stats.throttle_ratio()
+        backoff = self.backoff_factor / max(1.0 - throttle_ratio, 0.05) * random.uniform(0.5, 1.5)
+        return min(getattr(self, 'backoff_max', Retry.DEFAULT_BACKOFF_MAX), backoff)
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter, jehož spojení mají zapnutý TCP keepalive"""
+    
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = HTTPConnection.default_socket_options + KEEPALIVE_SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
 class SUKLAPIClient:
     """Klient pro komunikaci s SÚKL API"""
     
-    def __init__(self, base_url: str = "https://prehledy.sukl.cz/dlp/v1"):
+    def __init__(self, base_url: str = "https://prehledy.sukl.cz/dlp/v1",
+                 max_rate: float = 10, time_period: float = 1.0,
+                 eu_max_rate: float = 1, eu_time_period: float = 3.0,
+                 cache_name: str = "sukl", cache_expire_after: int = 86400):
         self.base_url = base_url
-        self.session = requests.Session()
+        # JSON odpovědi se ukládají do lokální SQLite cache, opakované běhy je nestahují
+        # znovu; po expiraci se posílá If-None-Match / If-Modified-Since. PDF se necachují -
+        # stahují se streamovaně a nezměněné odhalí SHA-256 v databázi. Když API selže,
+        # použije se i prošlá odpověď z cache (seznam a detaily léků se mění zřídka)
+        self.session = requests_cache.CachedSession(
+            cache_name=cache_name, backend='sqlite', expire_after=cache_expire_after,
+            urls_expire_after={'*/dokumenty/*': requests_cache.DO_NOT_CACHE},
+            stale_if_error=True
+        )
+        # Pool spojení pro souběžná vlákna a automatické opakování přechodných chyb.
+        # Komunikujeme s jediným hostem - stačí málo poolů, ale hodně spojení v poolu.
+        # pool_block: při vyčerpání poolu vlákno počká na volné keep-alive spojení
+        # místo otevření dalšího (a jeho zahození včetně TLS handshake)
+        self.throttle_stats = ThrottleStats()
+        adapter = KeepAliveAdapter(
+            pool_connections=4,
+            pool_maxsize=max(32, FETCH_WORKERS),
+            pool_block=True,
+            max_retries=AdaptiveRetry(
+                total=5,
+                backoff_factor=1.0,
+                status_forcelist=[429, 500, 502, 503, 504],
+                # Při 429/503 se čeká podle hlavičky Retry-After, pokud ji server pošle
+                respect_retry_after_header=True,
+                allowed_methods=['GET', 'HEAD'],
+                throttle_stats=self.throttle_stats
+            )
+        )
+        self.session.mount('https://', adapter)
+        # Místo pevných pauz omezujeme počet požadavků na SÚKL API
+        self.rate_limiter = RateLimiter(max_rate, time_period)
+        # Dokumenty EU registrací (EMA server) mají vlastní, přísnější limit
+        self.eu_rate_limiter = RateLimiter(eu_max_rate, eu_time_period)
+    
+    def _is_cached(self, url: str, params: Optional[Dict[str, Any]] = None) -> bool:
+        """Je pro URL v cache platná (neprošlá) odpověď?"""
+        # Dotaz only_if_cached nejde použít - se stale_if_error vrací i prošlé odpovědi
+        request = self.session.prepare_request(requests.Request('GET', url, params=params))
+        cached = self.session.cache.get_response(self.session.cache.create_key(request))
+        return cached is not None and not cached.is_expired
+    
+    def _get(self, url: str, **kwargs) -> requests.Response:
+        """GET požadavek s ohledem na rate limit (odpovědi z cache limit nečerpají)"""
+        if self._is_cached(url, kwargs.get('params')):
+            return self.session.get(url, **kwargs)
+        
+        self.rate_limiter.acquire()
+        response = self.session.get(url, **kwargs)
+        self.throttle_stats.record(response.status_code == 429)
+        return response
    
     def get_medicines_list(self, period: str = "2025.08", ) -> List[str]:
         """Získá seznam kódů léků"""
         params = f"obdobi={period}&uvedeneCeny=false&typSeznamu=dlpo"
         url = f"{self.base_url}/lecive-pripravky?{params}"
-        logger.info(f"URL pro seznam kodu: {url}")
+        logger.info("URL pro seznam kodu: %s", url)
         try:
-            logger.info(f"Stahuji seznam léků pro období {period}...")
-            response = self.session.get(url, timeout=30)
+            logger.info("Stahuji seznam léků pro období %s...", period)
+            response = self._get(url, timeout=30)
             response.raise_for_status()
             
-            logger.info(f"Status kód: {response.status_code}")
-            logger.info(f"Response headers: {dict(response.headers)}")
+            logger.info("Status kód: %s", response.status_code)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Response headers: %s", dict(response.headers))
             
-            data = response.json()
+            data = orjson.loads(response.content)
            
             codes = data if isinstance(data, list) else []
             
-            logger.info(f"Načteno {len(codes)} kódů léků")
+            logger.info("Načteno %s kódů léků", len(codes))
             return codes
             
         except Exception as e:
-            logger.error(f"Chyba při stahování seznamu léků: {e}")
+            logger.error("Chyba při stahování seznamu léků: %s", e)
             return []
     
     def get_medicine_detail(self, kod_sukl: str) -> Dict[str, Any]:
@@ -50,13 +459,13 @@ class SUKLAPIClient:
         url = f"{self.base_url}/lecive-pripravky/{kod_sukl}"
         
         try:
-            response = self.session.get(url, timeout=30)
+            response = self._get(url, timeout=30)
             response.raise_for_status()
             
-            return response.json()
+            return orjson.loads(response.content)
             
         except Exception as e:
-            logger.error(f"Chyba při stahování detailu léku {kod_sukl}: {e}")
+            logger.error("Chyba při stahování detailu léku %s: %s", kod_sukl, e)
             return {}
     
     def get_documents_metadata(self, kod_sukl: str, doc_type: str = "spc") -> List[Dict[str, Any]]:
@@ -65,10 +474,10 @@ class SUKLAPIClient:
         params = {'typ': doc_type}
         
         try:
-            response = self.session.get(url, params=params, timeout=30)
+            response = self._get(url, params=params, timeout=30)
             response.raise_for_status()
             
-            data = response.json()
+            data = orjson.loads(response.content)
             # Pokud je to jeden objekt, převedeme na list
             if isinstance(data, dict):
                 return [data]
@@ -78,53 +487,80 @@ class SUKLAPIClient:
                 return []
                 
         except Exception as e:
-            logger.error(f"Chyba při stahování metadat dokumentů pro {kod_sukl}: {e}")
+            logger.error("Chyba při stahování metadat dokumentů pro %s: %s", kod_sukl, e)
             return []
     
-    def download_document(self, kod_sukl: str, doc_type: str = "spc", is_eu_registration: bool = False, max_retries: int = 3) -> bytes:
-        """Stáhne PDF dokument podle kódu SÚKL a typu dokumentu"""
+    def head_document(self, kod_sukl: str, doc_type: str = "spc") -> Dict[str, str]:
+        """Zjistí hlavičky PDF dokumentu (HEAD) bez stažení jeho obsahu"""
+        url = f"{self.base_url}/dokumenty/{kod_sukl}/{doc_type}"
+        
+        try:
+            self.rate_limiter.acquire()
+            response = self.session.head(url, timeout=30, allow_redirects=True)
+            self.throttle_stats.record(response.status_code == 429)
+            response.raise_for_status()
+            return response.headers
+            
+        except Exception as e:
+            logger.warning("  ⚠️  HEAD dokumentu %s/%s selhal: %s", kod_sukl, doc_type, e)
+            return {}
+    
+    def download_document(self, kod_sukl: str, doc_type: str = "spc", is_eu_registration: bool = False, max_retries: int = 3) -> tuple:
+        """Stáhne (streamovaně) PDF dokument podle kódu SÚKL a typu dokumentu, vrací (PDF, ETag)"""
         url = f"{self.base_url}/dokumenty/{kod_sukl}/{doc_type}"
         
-        # Delší pauza pro EU registrace (EMA server)
+        # EU registrace (EMA server) - nejvýše jeden dokument za 3 sekundy napříč vlákny;
+        # pevná pauza by zdržela i vlákno, které žádný jiný EU dokument před sebou nemá
         if is_eu_registration:
-            logger.info(f"  ⚠️  EU registrace - používám delší pauzu pro EMA server")
-            time.sleep(3)  # 3 sekundy pro EMA
+            logger.info("  ⚠️  EU registrace - čekám na limit pro EMA server")
+            self.eu_rate_limiter.acquire()
         
         for attempt in range(max_retries):
             try:
-                response = self.session.get(url, timeout=60)
-                response.raise_for_status()
-                
-                return response.content
+                # PDF čteme po částech do jednoho bufferu - response.content by držel
+                # seznam částí i jejich spojenou kopii současně
+                with self._get(url, timeout=60, stream=True) as response:
+                    response.raise_for_status()
+                    
+                    # Příliš velké PDF poznáme podle hlavičky ještě před stažením těla
+                    content_length = int(response.headers.get('Content-Length') or 0)
+                    if content_length > MAX_PDF_SIZE:
+                        logger.warning("  ⚠️  Dokument %s/%s má %s bytes - přeskakuji", kod_sukl, doc_type, content_length)
+                        return bytearray(), None
+                    
+                    pdf_content = bytearray()
+                    for chunk in response.iter_content(chunk_size=PDF_CHUNK_SIZE):
+                        pdf_content.extend(chunk)
+                        # Server nemusí Content-Length poslat - limit hlídáme i při čtení
+                        if len(pdf_content) > MAX_PDF_SIZE:
+                            logger.warning("  ⚠️  Dokument %s/%s přesáhl %s bytes - přeskakuji", kod_sukl, doc_type, MAX_PDF_SIZE)
+                            return bytearray(), None
+                    return pdf_content, response.headers.get('ETag') or response.headers.get('Last-Modified')
                 
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 429:  # Too Many Requests
-                    wait_time = (2 ** attempt) * 5  # Exponential backoff: 5, 10, 20 sekund
-                    logger.warning(f"  ⚠️  429 Too Many Requests - čekám {wait_time}s (pokus {attempt + 1}/{max_retries})")
-                    if attempt < max_retries - 1:
-                        time.sleep(wait_time)
-                        continue
-                    else:
-                        logger.error(f"Příliš mnoho požadavků i po {max_retries} pokusech")
-                        return b""
-                else:
-                    raise
+            except requests.exceptions.RetryError as e:
+                # 429/5xx opakuje (s backoffem a Retry-After) už urllib3 - další pokus nemá smysl
+                logger.error("Příliš mnoho požadavků na dokument %s/%s: %s", kod_sukl, doc_type, e)
+                return bytearray(), None
+            
+            except requests.exceptions.HTTPError:
+                raise
                     
             except Exception as e:
-                logger.error(f"Chyba při stahování dokumentu {kod_sukl}/{doc_type}: {e}")
+                logger.error("Chyba při stahování dokumentu %s/%s: %s", kod_sukl, doc_type, e)
                 if attempt < max_retries - 1:
-                    logger.info(f"  🔄 Opakuji za 2 sekundy (pokus {attempt + 2}/{max_retries})")
+                    logger.info("  🔄 Opakuji za 2 sekundy (pokus %s/%s)", attempt + 2, max_retries)
                     time.sleep(2)
                     continue
-                return b""
+                return bytearray(), None
         
-        return b""
+        return bytearray(), None
 
 class DatabaseManager:
     """Správce databáze PostgreSQL"""
     
     def __init__(self, host: str = "localhost", port: int = 5432, 
-                 database: str = "test", user: str = "test", password: str = "test"):
+                 database: str = "test", user: str = "test", password: str = "test",
+                 reset: bool = False):
         self.connection_params = {
             'host': host,
             'port': port,
@@ -132,185 +568,395 @@ class DatabaseManager:
             'user': user,
             'password': password
         }
-        self.init_database()
+        # Jediné místo, kde se otevírají spojení - parametry se navážou jen jednou
+        self.connection_factory = functools.partial(pg8000.connect, **self.connection_params)
+        # Jedno dlouhodobé spojení pro migrace i zápisy - bez TCP/auth handshake na každou operaci
+        self.conn = self.connection_factory()
+        self.init_database(drop=reset)
+        # Přerušené hromadné načtení mohlo nechat dokumenty bez omezení
+        self.restore_document_constraints()
+        self.prepare_statements()
+        # (pdf_sha256, pdf_size, etag) uložených PDF podle (kod_sukl, dokument_id) -
+        # nezměněné dokumenty se nestahují ani nezapisují
+        self.document_versions = self.load_document_versions()
+        # Režim hromadného načtení - dokumenty jsou bez cizího klíče a unikátního indexu
+        self.bulk_load = False
+        # Léky a dokumenty čekající na hromadné uložení
+        self.medicine_buffer = []
+        self.document_buffer = []
+    
+    def commit(self):
+        """Potvrdí transakci na sdíleném spojení"""
+        self.conn.commit()
+    
+    def rollback(self):
+        """Zruší rozpracovanou transakci na sdíleném spojení"""
+        self.conn.rollback()
     
-    def init_database(self):
-        """Inicializuje databázi a vytvoří tabulky"""
+    def close(self):
+        """Uzavře databázové spojení"""
+        self.conn.close()
+    
+    def init_database(self, drop: bool = False):
+        """Inicializuje databázi - aplikuje chybějící migrace schématu, data zachová (drop=True vše smaže)"""
         try:
-            with pg8000.connect(**self.connection_params) as conn:
-                with conn.cursor() as cursor:
-                    
-                    # Smazat existující tabulky pro testování
-                    cursor.execute("DROP TABLE IF EXISTS dokumenty CASCADE")
-                    cursor.execute("DROP TABLE IF EXISTS leciva CASCADE")
-                    conn.commit()
-                    logger.info("Existující tabulky smazány")
-                    
-                    # Tabulka léků - vše jako string pro testování
-                    cursor.execute("""
-                        CREATE TABLE IF NOT EXISTS leciva (
-                            kod_sukl VARCHAR(20) PRIMARY KEY,
-                            nazev VARCHAR(500),
-                            sila VARCHAR(100),
-                            lekova_forma VARCHAR(100),
-                            baleni VARCHAR(50),
-                            cesta VARCHAR(50),
-                            doplnek TEXT,
-                            obal VARCHAR(50),
-                            drzitel VARCHAR(100),
-                            zeme_drzitele VARCHAR(50),
-                            stav_registrace VARCHAR(10),
-                            atc_kod VARCHAR(20),
-                            registracni_cislo VARCHAR(100),
-                            ddd_mnozstvi VARCHAR(20),
-                            ddd_jednotka VARCHAR(10),
-                            ddd_baleni VARCHAR(20),
-                            zpusob_vydeje VARCHAR(10),
-                            expirace VARCHAR(20),
-                            expirace_jednotka VARCHAR(10),
-                            registrovany_nazev VARCHAR(500),
-                            ochranne_prvky VARCHAR(10),
-                            jazyk_obalu VARCHAR(10),
-                            datum_registrace VARCHAR(20),
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        )
-                    """)
-                    
-                    # Tabulka dokumentů
-                    cursor.execute("""
-                        CREATE TABLE IF NOT EXISTS dokumenty (
-                            id SERIAL PRIMARY KEY,
-                            kod_sukl VARCHAR(20) REFERENCES leciva(kod_sukl),
-                            dokument_id VARCHAR(20),
-                            typ VARCHAR(50),
-                            nazev VARCHAR(500),
-                            pdf_data BYTEA,
-                            pdf_size INTEGER,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            UNIQUE(kod_sukl, dokument_id)
-                        )
-                    """)
-                    
-                    conn.commit()
-                    logger.info("Databáze inicializována")
-                    
+            with self.conn.cursor() as cursor:
+                
+                schema_sql = "CREATE TABLE IF NOT EXISTS schema_version (v INTEGER NOT NULL)"
+                if drop:
+                    # Pouze pro testování - smazání i nové vytvoření jde jedním dotazem
+                    schema_sql = DROP_TABLES_SQL + ";\n" + schema_sql
+                    logger.info("Mažu existující tabulky")
+                cursor.execute(schema_sql)
+                cursor.execute("SELECT COALESCE(MAX(v), 0) FROM schema_version")
+                current_version = cursor.fetchone()[0]
+                
+                # Všechny chybějící migrace včetně zápisu verzí jdou na server jedním dotazem
+                # (bez parametrů = jednoduchý protokol, více příkazů najednou) a v jedné transakci
+                pending = list(enumerate(SCHEMA_MIGRATIONS, 1))[current_version:]
+                if pending:
+                    cursor.execute(";\n".join(
+                        statement
+                        for version, statements in pending
+                        for statement in [*statements, f"INSERT INTO schema_version (v) VALUES ({version})"]
+                    ))
+                    logger.info(f"Schéma databáze migrováno z verze {current_version} na verzi {pending[-1][0]}")
+                
+                self.commit()
+                logger.info("Databáze inicializována")
+                
         except Exception as e:
+            self.rollback()
             logger.error(f"Chyba při inicializaci databáze: {e}")
             raise
     
-    def save_medicine(self, medicine_data: Dict[str, Any]) -> bool:
-        """Uloží data léku do databáze"""
+    @staticmethod
+    def _medicine_row(medicine_data: Dict[str, Any]) -> tuple:
+        """Převede detail léku na n-tici hodnot pro tabulku leciva"""
+        # Chybějící klíč i null z API dávají '' (ne 'None')
+        kod_sukl, nazev = medicine_data.get('kodSUKL'), medicine_data.get('nazev')
+        return ('' if kod_sukl is None else str(kod_sukl),
+                '' if nazev is None else str(nazev),
+                orjson.dumps(medicine_data).decode('utf-8'))
+    
+    def save_medicines_batch(self, medicines: List[Dict[str, Any]], page_size: int = MEDICINE_BATCH_SIZE) -> int:
+        """Hromadně uloží data léků do databáze, vrací počet uložených léků"""
+        # ON CONFLICT nesmí v jednom příkazu narazit na stejný klíč dvakrát - poslední výskyt vyhrává
+        rows = list({row[0]: row for row in map(self._medicine_row, medicines)}.values())
+        if not rows:
+            return 0
+        
         try:
-            with pg8000.connect(**self.connection_params) as conn:
-                with conn.cursor() as cursor:
-                    
-                    cursor.execute("""
-                        INSERT INTO leciva (
-                            kod_sukl, nazev, sila, lekova_forma, baleni, cesta,
-                            doplnek, obal, drzitel, zeme_drzitele, stav_registrace,
-                            atc_kod, registracni_cislo, ddd_mnozstvi, ddd_jednotka,
-                            ddd_baleni, zpusob_vydeje, expirace, expirace_jednotka,
-                            registrovany_nazev, ochranne_prvky, jazyk_obalu, datum_registrace
-                        ) VALUES (
-                            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                            %s, %s, %s, %s, %s, %s, %s, %s
-                        ) ON CONFLICT (kod_sukl) DO UPDATE SET
-                            nazev = EXCLUDED.nazev,
-                            sila = EXCLUDED.sila,
-                            lekova_forma = EXCLUDED.lekova_forma,
-                            baleni = EXCLUDED.baleni,
-                            cesta = EXCLUDED.cesta,
-                            doplnek = EXCLUDED.doplnek,
-                            obal = EXCLUDED.obal,
-                            drzitel = EXCLUDED.drzitel,
-                            zeme_drzitele = EXCLUDED.zeme_drzitele,
-                            stav_registrace = EXCLUDED.stav_registrace,
-                            atc_kod = EXCLUDED.atc_kod,
-                            registracni_cislo = EXCLUDED.registracni_cislo,
-                            ddd_mnozstvi = EXCLUDED.ddd_mnozstvi,
-                            ddd_jednotka = EXCLUDED.ddd_jednotka,
-                            ddd_baleni = EXCLUDED.ddd_baleni,
-                            zpusob_vydeje = EXCLUDED.zpusob_vydeje,
-                            expirace = EXCLUDED.expirace,
-                            expirace_jednotka = EXCLUDED.expirace_jednotka,
-                            registrovany_nazev = EXCLUDED.registrovany_nazev,
-                            ochranne_prvky = EXCLUDED.ochranne_prvky,
-                            jazyk_obalu = EXCLUDED.jazyk_obalu,
-                            datum_registrace = EXCLUDED.datum_registrace
-                    """, (
-                        str(medicine_data.get('kodSUKL', '')),
-                        str(medicine_data.get('nazev', '')),
-                        str(medicine_data.get('sila', '')),
-                        str(medicine_data.get('lekovaFormaKod', '')),
-                        str(medicine_data.get('baleni', '')),
-                        str(medicine_data.get('cestaKod', '')),
-                        str(medicine_data.get('doplnek', '')),
-                        str(medicine_data.get('obalKod', '')),
-                        str(medicine_data.get('drzitelKod', '')),
-                        str(medicine_data.get('zemeDrziteleKod', '')),
-                        str(medicine_data.get('stavRegistraceKod', '')),
-                        str(medicine_data.get('ATCkod', '')),
-                        str(medicine_data.get('registracniCislo', '')),
-                        str(medicine_data.get('dddMnozstvi', '')),
-                        str(medicine_data.get('dddMnozstviJednotka', '')),
-                        str(medicine_data.get('dddBaleni', '')),
-                        str(medicine_data.get('zpusobVydejeKod', '')),
-                        str(medicine_data.get('expirace', '')),
-                        str(medicine_data.get('expiraceJednotka', '')),
-                        str(medicine_data.get('registrovanyNazevLP', '')),
-                        str(medicine_data.get('ochrannePrvky', '')),
-                        str(medicine_data.get('jazykObalu', '')),
-                        str(medicine_data.get('datumRegistrace', ''))
-                    ))
-                    
-                    conn.commit()
-                    return True
-                    
+            for start in range(0, len(rows), page_size):
+                page = rows[start:start + page_size]
+                # Každý sloupec jde jako jedno pole - připravený příkaz funguje pro libovolnou velikost dávky
+                kod_sukl, nazev, data = [list(column) for column in zip(*page)]
+                self.medicine_upsert.run(kod_sukl=kod_sukl, nazev=nazev, data=data)
+            
+            # Jeden commit za celou dávku místo commitu po každém řádku
+            self.commit()
+            logger.info("Hromadně uloženo %s léků", len(rows))
+            return len(rows)
+                
         except Exception as e:
-            logger.error(f"Chyba při ukládání léku {medicine_data.get('kodSUKL')}: {e}")
-            return False
+            self.rollback()
+            logger.error("Chyba při hromadném ukládání %s léků: %s", len(rows), e)
+            return 0
+    
+    def prepare_statements(self):
+        """Připraví UPSERT léků a dokumentů na serveru - parse a plán se neopakují pro každou dávku"""
+        self.medicine_upsert = self.conn.prepare(MEDICINE_UPSERT_SQL)
+        with self.conn.cursor() as cursor:
+            cursor.execute(DOCUMENT_PREPARE_SQL)
+        self.commit()
+    
+    def queue_medicine(self, medicine_data: Dict[str, Any]):
+        """Zařadí lék do dávky pro hromadné uložení"""
+        self.medicine_buffer.append(medicine_data)
+    
+    def queue_document(self, kod_sukl: str, document_data: Dict[str, Any], pdf_content: bytes):
+        """Zařadí dokument do dávky pro hromadné uložení"""
+        self.document_buffer.append((kod_sukl, document_data, pdf_content))
     
-    def save_document(self, kod_sukl: str, document_data: Dict[str, Any], pdf_content: bytes) -> bool:
-        """Uloží dokument do databáze"""
+    def buffer_is_full(self) -> bool:
+        """Zjistí, zda je některá z dávek připravena k uložení"""
+        return (len(self.medicine_buffer) >= MEDICINE_BATCH_SIZE
+                or len(self.document_buffer) >= DOCUMENT_BATCH_SIZE
+                or sum(len(pdf_content) for _, _, pdf_content in self.document_buffer) >= DOCUMENT_BATCH_BYTES)
+    
+    def flush(self) -> int:
+        """Uloží nashromážděné léky a jejich dokumenty, vrací počet uložených dokumentů"""
+        if not self.medicine_buffer:
+            return 0
+        
+        document_count = 0
+        # Léky musí být uloženy dříve než dokumenty (cizí klíč dokumenty.kod_sukl)
+        if self.save_medicines_batch(self.medicine_buffer):
+            # Dávka nemusí obsahovat dokumenty - nezměněná PDF se nestahují
+            if self.document_buffer:
+                document_count = self.save_documents_batch(self.document_buffer)
+                if not document_count:
+                    logger.error("  ❌ Chyba při ukládání %s SPC dokumentů", len(self.document_buffer))
+        else:
+            logger.error("❌ Chyba při hromadném ukládání %s léčiv", len(self.medicine_buffer))
+        
+        self.medicine_buffer.clear()
+        self.document_buffer.clear()
+        return document_count
+    
+    def drop_document_constraints(self):
+        """Před hromadným načtením odstraní cizí klíč a unikátní index dokumentů"""
+        with self.conn.cursor() as cursor:
+            for name, _ in reversed(DOCUMENT_CONSTRAINTS):
+                cursor.execute(f"ALTER TABLE dokumenty DROP CONSTRAINT IF EXISTS {name}")
+        self.commit()
+        self.bulk_load = True
+        logger.info("Omezení tabulky dokumenty odstraněna pro hromadné načtení")
+    
+    def restore_document_constraints(self):
+        """Znovu vytvoří chybějící unikátní index a cizí klíč dokumentů (existující ponechá)"""
+        with self.conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT conname FROM pg_constraint
+                WHERE conrelid = 'dokumenty'::regclass
+            """)
+            existing = {row[0] for row in cursor.fetchall()}
+            missing = [(name, definition) for name, definition in DOCUMENT_CONSTRAINTS if name not in existing]
+            for name, definition in missing:
+                cursor.execute(f"ALTER TABLE dokumenty ADD CONSTRAINT {name} {definition}")
+        self.commit()
+        self.bulk_load = False
+        if missing:
+            logger.info("Omezení tabulky dokumenty obnovena: %s", ", ".join(name for name, _ in missing))
+    
+    def load_document_versions(self) -> Dict[tuple, tuple]:
+        """Načte SHA-256 otisky, velikosti a ETagy již uložených dokumentů"""
+        with self.conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT kod_sukl, dokument_id, pdf_sha256, pdf_size, etag
+                FROM dokumenty WHERE pdf_sha256 IS NOT NULL
+            """)
+            versions = {(row[0], row[1]): (row[2], row[3], row[4]) for row in cursor.fetchall()}
+        self.commit()
+        return versions
+    
+    def load_stored_medicines(self) -> Dict[str, str]:
+        """Načte kódy a názvy léků, které už mají uložený dokument"""
+        with self.conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT DISTINCT d.kod_sukl, l.nazev
+                FROM dokumenty d JOIN leciva l ON l.kod_sukl = d.kod_sukl
+            """)
+            stored = {row[0]: (row[1] or '').strip() for row in cursor.fetchall()}
+        self.commit()
+        return stored
+    
+    def save_documents_batch(self, documents: List[tuple]) -> int:
+        """Hromadně uloží dokumenty (kod_sukl, document_data, pdf_content), vrací počet uložených"""
+        rows = {}
+        unchanged = set()
+        for kod_sukl, document_data, pdf_content in documents:
+            dokument_id = str(document_data.get('id', ''))
+            pdf_sha256 = hashlib.sha256(pdf_content).hexdigest()
+            etag = document_data.get('etag')
+            key = (kod_sukl, dokument_id)
+            if self.document_versions.get(key) == (pdf_sha256, len(pdf_content), etag):
+                # Stejné PDF už v databázi je - neposíláme ho znovu
+                unchanged.add(key)
+                rows.pop(key, None)
+                continue
+            unchanged.discard(key)
+            rows[key] = (
+                kod_sukl,
+                dokument_id,
+                document_data.get('typ', 'spc'),
+                document_data.get('nazev', ''),
+                PDF_COMPRESSOR.compress(pdf_content),
+                len(pdf_content),
+                pdf_sha256,
+                PDF_ENCODING,
+                etag
+            )
+        if unchanged:
+            logger.info("Přeskočeno %s nezměněných dokumentů", len(unchanged))
+        if not rows:
+            return len(unchanged)
+        
         try:
-            with pg8000.connect(**self.connection_params) as conn:
-                with conn.cursor() as cursor:
-                    
-                    cursor.execute("""
-                        INSERT INTO dokumenty (
-                            kod_sukl, dokument_id, typ, nazev, pdf_data, pdf_size
-                        ) VALUES (%s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (kod_sukl, dokument_id) DO UPDATE SET
-                            typ = EXCLUDED.typ,
-                            nazev = EXCLUDED.nazev,
-                            pdf_data = EXCLUDED.pdf_data,
-                            pdf_size = EXCLUDED.pdf_size
-                    """, (
-                        kod_sukl,
-                        str(document_data.get('id', '')),
-                        document_data.get('typ', 'spc'),
-                        document_data.get('nazev', ''),
-                        pdf_content,
-                        len(pdf_content)
-                    ))
-                    
-                    conn.commit()
-                    return True
-                    
+            with self.conn.cursor() as cursor, \
+                    tempfile.SpooledTemporaryFile(max_size=COPY_SPOOL_SIZE) as copy_data:
+                copy_data.write(COPY_BINARY_HEADER)
+                for row in rows.values():
+                    write_copy_binary_row(copy_data, row)
+                copy_data.write(COPY_BINARY_TRAILER)
+                copy_data.seek(0)
+                
+                # COPY do UNLOGGED staging tabulky (bez WAL a bez kontrol indexů),
+                # pak jedním příkazem sloučit do tabulky dokumenty
+                cursor.execute(DOCUMENT_STAGE_TRUNCATE_SQL)
+                cursor.execute(DOCUMENT_COPY_SQL, stream=copy_data)
+                if self.bulk_load:
+                    # Bez unikátního indexu nelze použít ON CONFLICT - staré verze smažeme předem
+                    cursor.execute(DOCUMENT_BULK_MERGE_SQL)
+                else:
+                    cursor.execute(DOCUMENT_EXECUTE_SQL)
+                
+                self.commit()
+                self.document_versions.update({key: (row[6], row[5], row[8]) for key, row in rows.items()})
+                logger.info("Hromadně uloženo %s dokumentů", len(rows))
+                return len(rows) + len(unchanged)
+                
         except Exception as e:
-            logger.error(f"Chyba při ukládání dokumentu pro {kod_sukl}: {e}")
-            return False
+            self.rollback()
+            logger.error("Chyba při hromadném ukládání %s dokumentů: %s", len(rows), e)
+            return 0
+
+class DatabaseWriter(threading.Thread):
+    """Vlákno, které z fronty ukládá léky a dokumenty do databáze po dávkách"""
+    
+    def __init__(self, db_manager: DatabaseManager, queue_size: int = 1000,
+                 flush_interval: float = WRITER_FLUSH_INTERVAL):
+        super().__init__(name="db-writer", daemon=True)
+        self.db_manager = db_manager
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.flush_interval = flush_interval
+        self.document_count = 0
+    
+    def put(self, kod_sukl: str, medicine_detail: Dict[str, Any], doc_data: Dict[str, Any], pdf_content: bytes):
+        """Zařadí lék a jeho dokument k uložení (při plné frontě čeká, pdf_content None = jen lék)"""
+        self.queue.put((kod_sukl, medicine_detail, doc_data, pdf_content))
+    
+    def close(self) -> int:
+        """Uloží zbytek fronty, ukončí vlákno a vrátí počet uložených dokumentů"""
+        self.queue.put(None)
+        self.join()
+        return self.document_count
+    
+    def run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                # Chvíli nic nepřišlo - uložíme rozpracovanou dávku
+                self.document_count += self.db_manager.flush()
+                continue
+            
+            if item is None:
+                break
+            
+            kod_sukl, medicine_detail, doc_data, pdf_content = item
+            self.db_manager.queue_medicine(medicine_detail)
+            if pdf_content is not None:
+                self.db_manager.queue_document(kod_sukl, doc_data, pdf_content)
+            if self.db_manager.buffer_is_full():
+                self.document_count += self.db_manager.flush()
+        
+        self.document_count += self.db_manager.flush()
+
+def document_unchanged(headers: Dict[str, str], stored_version: tuple) -> bool:
+    """Porovná hlavičky z HEAD s uloženou verzí dokumentu (pdf_sha256, pdf_size, etag)"""
+    if not stored_version:
+        return False
+    _, pdf_size, etag = stored_version
+    # Bez ETagu / Last-Modified nelze shodu potvrdit - samotná velikost nestačí
+    server_etag = headers.get('ETag') or headers.get('Last-Modified')
+    if not etag or server_etag != etag:
+        return False
+    content_length = headers.get('Content-Length')
+    return content_length is None or int(content_length) == pdf_size
+
+def fetch_medicine(api_client: SUKLAPIClient, kod_sukl: str, saved_medicine_names: set,
+                   document_versions: Dict[tuple, tuple],
+                   skip_eu_registrations: bool = SKIP_EU_REGISTRATIONS) -> Dict[str, Any]:
+    """Stáhne detail léku, vyfiltruje ho a stáhne jeho SPC dokument (běží ve vlákně)"""
+    result = {'kod_sukl': kod_sukl, 'status': 'ok'}
+    
+    # 2. Získání detailu léku
+    medicine_detail = api_client.get_medicine_detail(kod_sukl)
+    
+    if not medicine_detail:
+        logger.warning("  ⚠️  Nepodařilo se získat detail léku %s", kod_sukl)
+        result['status'] = 'no_detail'
+        return result
+    
+    # Kontrola ATC kódu - zajímají nás jen léky s rozmanitými indikacemi
+    atc_kod = medicine_detail.get('ATCkod', '')
+    if atc_kod:
+        # Kontrola, zda ATC kód začíná některým z zajímavých kódů
+        is_interesting = atc_kod.startswith(INTERESTING_ATC_PREFIXES)
+        if not is_interesting:
+            logger.debug("  ⏭️  Přeskakuji lék %s s ATC %s - není v zajímavých kategoriích", kod_sukl, atc_kod)
+            result['status'] = 'skipped_atc'
+            return result
+        else:
+            logger.debug("  ✅ Zajímavý ATC kód: %s (%s)", atc_kod, kod_sukl)
+    else:
+        logger.debug("  ⚠️  Lék %s bez ATC kódu - přeskakuji", kod_sukl)
+        result['status'] = 'skipped_atc'
+        return result
+    
+    # Kontrola názvu - vyhnout se kontrastním látkám a diagnostickým přípravkům
+    if SKIP_KEYWORDS_PATTERN.search(medicine_detail.get('nazev', '')):
+        logger.info("  ⏭️  Přeskakuji kontrastní látku: %s", medicine_detail.get('nazev', kod_sukl))
+        result['status'] = 'skipped_contrast'
+        return result
+    
+    # Kontrola EU registrace
+    registracni_cislo = medicine_detail.get('registracniCislo', '')
+    is_eu_registration = str(registracni_cislo).startswith('EU')
+    
+    # Přeskočení celého léčiva pokud je EU registrace a nechceme je
+    if is_eu_registration and skip_eu_registrations:
+        logger.info("  ⏭️  Přeskakuji celé léčivo s EU registrací: %s (%s)", registracni_cislo, medicine_detail.get('nazev', kod_sukl))
+        result['status'] = 'skipped_eu'
+        return result
+    
+    if is_eu_registration:
+        logger.info("  🇪🇺 EU registrace: %s", registracni_cislo)
+    
+    # Předběžná kontrola duplicitních názvů, aby se zbytečně nestahovalo PDF
+    # (definitivní kontrolu dělá hlavní vlákno)
+    medicine_name = medicine_detail.get('nazev', '').strip()
+    result['detail'] = medicine_detail
+    result['medicine_name'] = medicine_name
+    if medicine_name in saved_medicine_names:
+        result['status'] = 'skipped_duplicate'
+        return result
+    
+    doc_data = {
+        'id': kod_sukl,
+        'nazev': f'SPC_{kod_sukl}.pdf',
+        'typ': 'spc'
+    }
+    result['doc_data'] = doc_data
+    
+    # 3. HEAD kontrola - pokud se PDF na serveru nezměnilo, vůbec ho nestahujeme
+    # (nový dokument nemá s čím porovnat, HEAD by byl jen zbytečný round-trip navíc)
+    stored_version = document_versions.get((kod_sukl, doc_data['id']))
+    if stored_version and document_unchanged(api_client.head_document(kod_sukl, "spc"), stored_version):
+        logger.info("  ♻️  SPC dokument pro %s se nezměnil - nestahuji", kod_sukl)
+        result['status'] = 'unchanged'
+        result['pdf_content'] = None
+        return result
+    
+    # 4. Stahování SPC dokumentu (ETag z odpovědi se uloží pro příští HEAD kontrolu)
+    logger.info("  📄 Stahuji SPC dokument pro %s", kod_sukl)
+    
+    pdf_content, doc_data['etag'] = api_client.download_document(kod_sukl, "spc", is_eu_registration)
+    if not pdf_content:
+        logger.warning("  ⚠️  Prázdný SPC dokument pro %s - přeskakuji", kod_sukl)
+        result['status'] = 'no_pdf'
+        return result
+    
+    result['pdf_content'] = pdf_content
+    return result
 
 def main():
     """Hlavní funkce pro stahování dat"""
     logger.info("🚀 Začínám stahování dat z SÚKL API")
     
-    # Konfigurace
-    SKIP_EU_REGISTRATIONS = True  # Nastavte na False pokud chcete stahovat i EU registrace
-    
-    # Inicializace klientů
+    # Inicializace klienta
     api_client = SUKLAPIClient()
-    db_manager = DatabaseManager()
     
     # 1. Získání seznamu léků
     medicine_codes = api_client.get_medicines_list()
@@ -321,171 +967,153 @@ def main():
     
     logger.info(f"Načteno {len(medicine_codes)} léků k zpracování")
     
-    # Nastavení pro test
-    TARGET_MEDICINES = 15  # Počet léčiv s PDF, které chceme získat
-    MAX_ATTEMPTS = 10000    # Maximální počet pokusů (aby se nám nezacyklilo)
-    
-    # ATC kódy pro léky s rozmanitými indikacemi
-    INTERESTING_ATC_CODES = [
-        'N02B',  # Analgetika (Paralen, Ibalgin)
-        'J01C',  # Beta-laktamová antibiotika (peniciliny)
-        'J01D',  # Cefalosporiny
-        'J01F',  # Makrolidy (azitromycin)
-        'J01M',  # Chinolony
-        'N05B',  # Anxiolytika (diazepam)
-        'N05C',  # Hypnotika a sedativa
-        'N06A',  # Antidepresiva
-        'A02B',  # Antacida a antiulcerózní léky
-        'C03',   # Diuretika
-        'C07',   # Beta-blokátory
-        'C08',   # Blokátory kalciových kanálů
-        'C09',   # ACE inhibitory a sartany
-        'M01A',  # Nesteroidní antirevmatika
-        'R06A',  # Antihistaminika (Kynedryl)
-        'R05',   # Antitusika a expektorancia
-        'A03',   # Spasmolytika
-        'A06',   # Laxativa
-        'A07',   # Antidiarrhoika
-        'D01',   # Antimykotika
-        'D06',   # Antibiotika a chemoterapeutika pro lokální použití
-        'G01',   # Gynekologická antimikrobiální látka
-        'H02',   # Kortikosteroidy pro systémové použití
-        'H03',   # Thyroidální hormony
-        'L01',   # Cytostatika
-        'P01',   # Antiprotozoální látky
-        'S01',   # Oftalmologické přípravky
-        'S02',   # Otologické přípravky
-    ]
-    
-    success_count = 0
-    document_count = 0
-    skipped_eu_count = 0
-    skipped_atc_count = 0
-    skipped_contrast_count = 0
-    skipped_duplicate_count = 0
-    processed_count = 0
-    
-    # Set pro sledování již uložených názvů léků
-    saved_medicine_names = set()
-    
-    logger.info(f"Cíl: získat {TARGET_MEDICINES} léčiv s PDF dokumenty (max {MAX_ATTEMPTS} pokusů)")
-    
-    for kod_sukl in medicine_codes:
-        processed_count += 1
-        logger.info(f"Zpracovávám {processed_count}: {kod_sukl} (úspěšně: {success_count}/{TARGET_MEDICINES})")
+    # Jedno databázové spojení pro celý běh, uzavře se i při chybě
+    # SUKL_RESET_DB=1 smaže existující tabulky (jinak se data zachovají)
+    db_manager = DatabaseManager(reset=os.environ.get('SUKL_RESET_DB') == '1')
+    try:
+        # Nastavení pro test
+        TARGET_MEDICINES = 15  # Počet léčiv s PDF, které chceme získat
+        MAX_ATTEMPTS = 10000    # Maximální počet pokusů (aby se nám nezacyklilo)
         
-        # Kontrola ukončení - buď dosáhli cíle nebo vyčerpali pokusy
-        if success_count >= TARGET_MEDICINES:
-            logger.info(f"🎯 Dosažen cíl {TARGET_MEDICINES} léčiv s PDF!")
-            break
+        success_count = 0
+        skipped_eu_count = 0
+        skipped_atc_count = 0
+        skipped_contrast_count = 0
+        skipped_duplicate_count = 0
+        unchanged_count = 0
+        resumed_count = 0
+        processed_count = 0
         
-        if processed_count > MAX_ATTEMPTS:
-            logger.warning(f"⚠️  Dosažen limit {MAX_ATTEMPTS} pokusů")
-            break
+        # Set pro sledování již uložených názvů léků
+        saved_medicine_names = set()
+        
+        # Léky s PDF z předchozích běhů se nestahují vůbec (navázání na přerušený běh)
+        stored_medicines = db_manager.load_stored_medicines() if SKIP_STORED_DOCUMENTS else {}
+        if stored_medicines:
+            logger.info(f"V databázi je už {len(stored_medicines)} léčiv s PDF - ty se nestahují")
+        
+        # Velké načtení běží bez kontrol cizího klíče a unikátního indexu, ty se obnoví na konci.
+        # Omezení mění hlavní vlákno, dokud zapisovací vlákno spojení nepoužívá
+        bulk_load = TARGET_MEDICINES >= BULK_LOAD_THRESHOLD
+        if bulk_load:
+            db_manager.drop_document_constraints()
+        # Ukládání do databáze běží ve vlastním vlákně, stahování na něj nečeká
+        db_writer = DatabaseWriter(db_manager)
+        db_writer.start()
+        
+        logger.info(f"Cíl: získat {TARGET_MEDICINES} léčiv s PDF dokumenty (max {MAX_ATTEMPTS} pokusů, {FETCH_WORKERS} vláken)")
         
         try:
-            # 2. Získání detailu léku
-            medicine_detail = api_client.get_medicine_detail(kod_sukl)
-            
-            if not medicine_detail:
-                logger.warning(f"  ⚠️  Nepodařilo se získat detail léku {kod_sukl}")
-                continue
-            
-            # Kontrola ATC kódu - zajímají nás jen léky s rozmanitými indikacemi
-            atc_kod = medicine_detail.get('ATCkod', '')
-            if atc_kod:
-                # Kontrola, zda ATC kód začíná některým z zajímavých kódů
-                is_interesting = any(atc_kod.startswith(code) for code in INTERESTING_ATC_CODES)
-                if not is_interesting:
-                    logger.info(f"  ⏭️  Přeskakuji lék s ATC {atc_kod} - není v zajímavých kategoriích")
-                    skipped_atc_count += 1
-                    continue
-                else:
-                    logger.info(f"  ✅ Zajímavý ATC kód: {atc_kod}")
-            else:
-                logger.info(f"  ⚠️  Lék bez ATC kódu - přeskakuji")
-                skipped_atc_count += 1
-                continue
-            
-            # Kontrola názvu - vyhnout se kontrastním látkám a diagnostickým přípravkům
-            nazev = medicine_detail.get('nazev', '').lower()
-            skip_keywords = ['iomeron', 'omnipaque', 'ultravist', 'iopamiro', 'iopromid', 
-                           'gadolinium', 'gadovist', 'dotarem', 'primovist', 'magnevist',
-                           'kontrast', 'kontrastní', 'diagnostický', 'diagnostika']
-            
-            if any(keyword in nazev for keyword in skip_keywords):
-                logger.info(f"  ⏭️  Přeskakuji kontrastní látku: {medicine_detail.get('nazev', kod_sukl)}")
-                skipped_contrast_count += 1
-                continue
-            
-            # Kontrola EU registrace
-            registracni_cislo = medicine_detail.get('registracniCislo', '')
-            is_eu_registration = str(registracni_cislo).startswith('EU')
-            
-            # Přeskočení celého léčiva pokud je EU registrace a nechceme je
-            if is_eu_registration and SKIP_EU_REGISTRATIONS:
-                logger.info(f"  ⏭️  Přeskakuji celé léčivo s EU registrací: {registracni_cislo} ({medicine_detail.get('nazev', kod_sukl)})")
-                skipped_eu_count += 1
-                continue
-            
-            if is_eu_registration:
-                logger.info(f"  🇪🇺 EU registrace: {registracni_cislo}")
-            
-            # Kontrola duplicitních názvů - přeskočit pokud už máme lék se stejným názvem
-            medicine_name = medicine_detail.get('nazev', '').strip()
-            if medicine_name in saved_medicine_names:
-                logger.info(f"  ⏭️  Přeskakuji duplicitní název: {medicine_name} (už máme)")
-                skipped_duplicate_count += 1
-                continue
-            
-            # 3. Stahování SPC dokumentu nejdříve
-            logger.info(f"  📄 Stahuji SPC dokument pro {kod_sukl}")
-            
-            pdf_content = api_client.download_document(kod_sukl, "spc", is_eu_registration)
-            if not pdf_content:
-                logger.warning(f"  ⚠️  Prázdný SPC dokument pro {kod_sukl} - přeskakuji")
-                continue
-            
-            # 4. Uložení léčiva do databáze (pouze pokud máme PDF)
-            if not db_manager.save_medicine(medicine_detail):
-                logger.error(f"❌ Chyba při ukládání léčiva: {kod_sukl}")
-                continue
-            
-            # 5. Uložení PDF dokumentu
-            doc_data = {
-                'id': kod_sukl,
-                'nazev': f'SPC_{kod_sukl}.pdf',
-                'typ': 'spc'
-            }
-            if db_manager.save_document(kod_sukl, doc_data, pdf_content):
-                success_count += 1
-                document_count += 1
-                # Přidat název léku do setu pro kontrolu duplicit
-                saved_medicine_names.add(medicine_name)
-                logger.info(f"✅ Léčivo a PDF uloženo: {medicine_detail.get('nazev', kod_sukl)} ({len(pdf_content)} bytes)")
-            else:
-                logger.error(f"  ❌ Chyba při ukládání SPC dokumentu")
-            
-            # Pauza mezi požadavky - kratší pro lokální SÚKL, delší už je v download_document pro EMA
-            time.sleep(0.5 if not is_eu_registration else 1)
-            
-        except Exception as e:
-            logger.error(f"Chyba při zpracování {kod_sukl}: {e}")
-            continue
-    
-    logger.info("=" * 50)
-    logger.info(f"🎉 Stahování dokončeno!")
-    logger.info(f"📊 Statistiky:")
-    logger.info(f"   • Zpracováno léčiv: {processed_count}")
-    logger.info(f"   • Úspěšně uloženo léčiv s PDF: {success_count}")
-    logger.info(f"   • Úspěšně uloženo dokumentů: {document_count}")
-    logger.info(f"   • Přeskočeno EU registrací: {skipped_eu_count}")
-    logger.info(f"   • Přeskočeno nezájímavých ATC: {skipped_atc_count}")
-    logger.info(f"   • Přeskočeno kontrastních látek: {skipped_contrast_count}")
-    logger.info(f"   • Přeskočeno duplicitních názvů: {skipped_duplicate_count}")
-    logger.info(f"ℹ️  Pro stahování EU registrací nastavte SKIP_EU_REGISTRATIONS = False")
-    logger.info(f"ℹ️  Filtrujeme jen léky s ATC kódy: {', '.join(INTERESTING_ATC_CODES[:10])}...")
-    logger.info(f"ℹ️  Kontrolujeme duplicitní názvy - každý lék jen jednou")
+            code_iter = iter(medicine_codes[:MAX_ATTEMPTS])
+            with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+                pending = set()
+                while True:
+                    # Omezený počet rozpracovaných léků - po dosažení cíle se zbytečně nestahuje dál
+                    while success_count < TARGET_MEDICINES and len(pending) < FETCH_WORKERS * 2:
+                        kod_sukl = next(code_iter, None)
+                        if kod_sukl is None:
+                            break
+                        if kod_sukl in stored_medicines:
+                            # Uložené léčivo se počítá do cíle bez jediného HTTP požadavku
+                            medicine_name = stored_medicines[kod_sukl]
+                            if medicine_name not in saved_medicine_names:
+                                saved_medicine_names.add(medicine_name)
+                                success_count += 1
+                                resumed_count += 1
+                            continue
+                        pending.add(executor.submit(fetch_medicine, api_client, kod_sukl, saved_medicine_names,
+                                                     db_manager.document_versions))
+                    
+                    if not pending:
+                        break
+                    
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        # Kontrola ukončení - výsledky po dosažení cíle zahodíme
+                        if success_count >= TARGET_MEDICINES:
+                            break
+                        
+                        processed_count += 1
+                        # Přeskočené léky se logují jen na úrovni DEBUG - průběh hlásíme po stovkách
+                        if processed_count % PROGRESS_LOG_INTERVAL == 0:
+                            logger.info("⏳ Zpracováno %s léčiv, připraveno %s/%s",
+                                        processed_count, success_count, TARGET_MEDICINES)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            logger.error("Chyba při zpracování léku: %s", e)
+                            continue
+                        
+                        kod_sukl = result['kod_sukl']
+                        status = result['status']
+                        if status == 'skipped_atc':
+                            skipped_atc_count += 1
+                            continue
+                        if status == 'skipped_contrast':
+                            skipped_contrast_count += 1
+                            continue
+                        if status == 'skipped_eu':
+                            skipped_eu_count += 1
+                            continue
+                        if status not in ('ok', 'unchanged', 'skipped_duplicate'):
+                            continue
+                        
+                        # Kontrola duplicitních názvů - přeskočit pokud už máme lék se stejným názvem
+                        medicine_detail = result['detail']
+                        medicine_name = result['medicine_name']
+                        if status == 'skipped_duplicate' or medicine_name in saved_medicine_names:
+                            logger.info("  ⏭️  Přeskakuji duplicitní název: %s (už máme)", medicine_name)
+                            skipped_duplicate_count += 1
+                            continue
+                        
+                        # 5. Zařazení léčiva a PDF do dávky (pouze pokud máme PDF, nezměněné PDF už v databázi je)
+                        pdf_content = result['pdf_content']
+                        db_writer.put(kod_sukl, medicine_detail, result['doc_data'], pdf_content)
+                        success_count += 1
+                        # Přidat název léku do setu pro kontrolu duplicit
+                        saved_medicine_names.add(medicine_name)
+                        if pdf_content is None:
+                            unchanged_count += 1
+                            logger.info("✅ Léčivo připraveno k uložení, PDF beze změny (%s/%s): %s",
+                                        success_count, TARGET_MEDICINES, medicine_detail.get('nazev', kod_sukl))
+                        else:
+                            logger.info("✅ Léčivo a PDF připraveno k uložení (%s/%s): %s (%s bytes)",
+                                        success_count, TARGET_MEDICINES, medicine_detail.get('nazev', kod_sukl),
+                                        len(pdf_content))
+                    
+                    if success_count >= TARGET_MEDICINES:
+                        logger.info(f"🎯 Dosažen cíl {TARGET_MEDICINES} léčiv s PDF!")
+                        for future in pending:
+                            future.cancel()
+                        break
+        finally:
+            # Uložení zbytku dávky
+            try:
+                document_count = db_writer.close()
+            finally:
+                if bulk_load:
+                    db_manager.restore_document_constraints()
+        
+        if success_count < TARGET_MEDICINES and len(medicine_codes) > MAX_ATTEMPTS:
+            logger.warning(f"⚠️  Dosažen limit {MAX_ATTEMPTS} pokusů")
+        
+        logger.info("=" * 50)
+        logger.info(f"🎉 Stahování dokončeno!")
+        logger.info(f"📊 Statistiky:")
+        logger.info(f"   • Zpracováno léčiv: {processed_count}")
+        logger.info(f"   • Zpracováno léčiv s PDF: {success_count}")
+        logger.info(f"   • Úspěšně uloženo dokumentů: {document_count}")
+        logger.info(f"   • Nezměněných dokumentů (bez stažení): {unchanged_count}")
+        logger.info(f"   • Léčiv s PDF z předchozích běhů: {resumed_count}")
+        logger.info(f"   • Přeskočeno EU registrací: {skipped_eu_count}")
+        logger.info(f"   • Přeskočeno nezájímavých ATC: {skipped_atc_count}")
+        logger.info(f"   • Přeskočeno kontrastních látek: {skipped_contrast_count}")
+        logger.info(f"   • Přeskočeno duplicitních názvů: {skipped_duplicate_count}")
+        logger.info(f"ℹ️  Pro stahování EU registrací nastavte SKIP_EU_REGISTRATIONS = False")
+        logger.info(f"ℹ️  Filtrujeme jen léky s ATC kódy: {', '.join(INTERESTING_ATC_CODES[:10])}...")
+        logger.info(f"ℹ️  Kontrolujeme duplicitní názvy - každý lék jen jednou")
+    finally:
+        db_manager.close()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
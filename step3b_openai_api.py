@@ -5,246 +5,140 @@ Alternativa k Ollama s použitím OpenAI API
 """
 
 import requests
-import pg8000
 import json
-import time
+import re
 from typing import List, Dict, Any, Optional
 import logging
-import pdfplumber
-from openai import OpenAI
-from io import BytesIO
+from openai import OpenAI, OpenAIError
 from openai_config import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_MAX_TOKENS, OPENAI_SEED
+from spc_extraction import ExtractionDatabase, extract_pending_medicines, slice_spc_sections, split_spc_sections
 
 # Nastavení logování
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Instrukce pro model - stejná pro všechny léky, proto je na začátku konverzace
+EXTRACTION_SYSTEM_PROMPT = """Analyzuj text z SPC (Souhrn údajů o přípravku) léku, který pošle uživatel.
+
+Extrahuj následující informace a vrať je v JSON formátu:
+
+{
+    "indikace": [""],
+    "davkovani": [""]
+}"""
+
+# Verze promptu v cache výsledků - zvyšte po změně EXTRACTION_SYSTEM_PROMPT, SPC_SECTIONS nebo
+# DETERMINISTIC_SECTIONS (i oddíly převzaté bez modelu se ukládají do cache),
+# jinak se použijí výsledky uložené se starým promptem
+PROMPT_VERSION = 1
+# Souběžné požadavky na OpenAI API - nastavte podle limitů (RPM/TPM) svého účtu
+OPENAI_WORKERS = 8
+# Opakování při 429/5xx - klient čeká podle hlavičky Retry-After s exponenciálním backoffem
+OPENAI_MAX_RETRIES = 5
+# Oddíly SPC, ze kterých model čte: terapeutické indikace a dávkování
+SPC_SECTIONS = ('4.1', '4.2')
+# Maximální délka textu SPC posílaného modelu (znaky)
+SPC_TEXT_LIMIT = 2000
+# Oddíly, které jdou ze SPC převzít přímo bez modelu (klíč odpovědi, číslo oddílu)
+DETERMINISTIC_SECTIONS = (('indikace', '4.1'), ('davkovani', '4.2'))
+# Maximální délka oddílu převzatého bez modelu (znaky)
+DETERMINISTIC_SECTION_LIMIT = 4000
+# Odrážka na začátku řádku - odděluje položky seznamu v oddílu
+SPC_BULLET_PATTERN = re.compile(r'^[ \t]*[•▪◦\-–][ \t]*', re.MULTILINE)
+
+# Klíče ve sloupci extracted_info.extracted a odpovídající klíče v JSON odpovědi modelu
+EXTRACTED_INFO_FIELDS = (
+    ('indikace', 'indikace'),
+    ('davkovani', 'davkovani'),
+)
+# JSON schéma odpovědi - model generuje jen tokeny, které schématu odpovídají, výstup je vždy platný JSON
+EXTRACTION_SCHEMA = {
+    'type': 'object',
+    'properties': {key: {'type': 'array', 'items': {'type': 'string'}} for _, key in EXTRACTED_INFO_FIELDS},
+    'required': [key for _, key in EXTRACTED_INFO_FIELDS],
+    'additionalProperties': False,
+}
+
+def deterministic_extract(text: str) -> Optional[Dict[str, List[str]]]:
+    """Převezme oddíly SPC přímo z textu bez modelu, None pokud některý oddíl chybí"""
+    found = split_spc_sections(text)
+    result = {}
+    for key, number in DETERMINISTIC_SECTIONS:
+        # Text oddílu bez řádku s nadpisem
+        body = found.get(number, '').partition('\n')[2].strip()
+        if not body:
+            return None
+        items = SPC_BULLET_PATTERN.split(body[:DETERMINISTIC_SECTION_LIMIT])
+        result[key] = [' '.join(item.split()) for item in items if item.strip()]
+    return result
+
 class PDFExtractor:
     """Třída pro extrakci textu z PDF s OpenAI API"""
     
     def __init__(self, api_key: str):
-        self.openai_client = OpenAI(api_key=api_key)
-    
-    def extract_text_from_pdf(self, pdf_content: bytes) -> str:
-        """Extrahuje text z PDF dokumentu"""
-        try:
-            with BytesIO(pdf_content) as pdf_file:
-                with pdfplumber.open(pdf_file) as pdf:
-                    text = ""
-                    for page in pdf.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text += page_text + "\n"
-                    
-                    logger.info(f"Extrahováno {len(text)} znaků textu z PDF")
-                    return text
-                    
-        except Exception as e:
-            logger.error(f"Chyba při extrakci textu z PDF: {e}")
-            return ""
+        self.openai_client = OpenAI(api_key=api_key, max_retries=OPENAI_MAX_RETRIES)
     
     def extract_medicine_info(self, text: str, kod_sukl: str) -> Dict[str, Any]:
         """Extrahuje informace o léku pomocí OpenAI API"""
         try:
-                        # Prompt pro OpenAI API
-            prompt = f"""
-            Analyzuj následující text z SPC (Souhrn údajů o přípravku) pro lék s kódem SÚKL: {kod_sukl}
-            
-            Extrahuj následující informace a vrať je v JSON formátu:
-            
-            {{
-                "indikace": [""],
-                "davkovani": [""],
-          }}
-            Text: {text[:2000]}
-        """
-
-            
-            # Volání OpenAI API
+            # Statická instrukce jde jako systémová zpráva, proměnný text SPC až za ní
             response = self.openai_client.chat.completions.create(
                 model=OPENAI_MODEL,
-                messages=[{
-                    'role': 'user',
-                    'content': prompt
-                }],
+                messages=[
+                    {'role': 'system', 'content': EXTRACTION_SYSTEM_PROMPT},
+                    {'role': 'user', 'content': f"Kód SÚKL: {kod_sukl}\n\nText: {slice_spc_sections(text, SPC_SECTIONS, SPC_TEXT_LIMIT)}"}
+                ],
                 # temperature=0.0 není podporováno GPT-5-nano, používá výchozí 1.0
-                response_format={"type": "json_object"},  # Zajišťuje JSON výstup
+                response_format={
+                    "type": "json_schema",
+                    "json_schema": {"name": "spc_extrakce", "schema": EXTRACTION_SCHEMA, "strict": True}
+                },
                 seed=OPENAI_SEED
             )
             
-            # Parsování JSON odpovědi
-            try:
-                content = response.choices[0].message.content
-                if content is None:
-                    logger.error(f"Prázdný obsah odpovědi pro {kod_sukl}")
-                    return {}
-                    
-                result = json.loads(content)
-                logger.info(f"Úspěšně extrahovány informace pro {kod_sukl}")
-                return result
-            except json.JSONDecodeError as e:
-                logger.error(f"Chyba při parsování JSON odpovědi pro {kod_sukl}: {e}")
-                logger.error(f"Odpověď: {content}")
+            # Odpověď odpovídá schématu, prázdná je jen při odmítnutí modelem
+            message = response.choices[0].message
+            if message.content is None:
+                logger.error(f"Model odmítl odpovědět pro {kod_sukl}: {message.refusal}")
                 return {}
-                
-        except Exception as e:
+            
+            result = json.loads(message.content)
+            logger.info(f"Úspěšně extrahovány informace pro {kod_sukl}")
+            return result
+            
+        except (OpenAIError, json.JSONDecodeError) as e:
+            # Jen chyby API a neplatná odpověď - chyby v kódu (NameError apod.) se nesmí tvářit jako výpadek API
             logger.error(f"Chyba při OpenAI API extrakci pro {kod_sukl}: {e}")
             return {}
 
-class DatabaseManager:
-    """Rozšířený správce databáze pro ukládání extrahovaných informací"""
-    
-    def __init__(self, host: str = "localhost", port: int = 5432, 
-                 database: str = "test", user: str = "test", password: str = "test"):
-        self.connection_params = {
-            'host': host,
-            'port': port,
-            'database': database,
-            'user': user,
-            'password': password
-        }
-        self.init_extraction_tables()
-    
-    def init_extraction_tables(self):
-        """Vytvoří tabulky pro extrahované informace"""
-        try:
-            logger.info("Připojuji k databázi...")
-            with pg8000.connect(**self.connection_params) as conn:
-                logger.info("Připojení úspěšné, vytvářím tabulky...")
-                with conn.cursor() as cursor:
-                    
-                    # Tabulka pro extrahované informace
-                    logger.info("Vytvářím tabulku extracted_info...")
-                    cursor.execute("""
-                        CREATE TABLE IF NOT EXISTS extracted_info (
-                            id SERIAL PRIMARY KEY,
-                            kod_sukl VARCHAR(20) REFERENCES leciva(kod_sukl) UNIQUE,
-                            indikace TEXT[],
-                            davkovani TEXT[],
-                            extracted_text TEXT,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        )
-                    """)
-                    logger.info("Tabulka extracted_info vytvořena")
-                    
-                    # Tabulka pro vyhledávání
-                    logger.info("Vytvářím tabulku search_index...")
-                    cursor.execute("""
-                        CREATE TABLE IF NOT EXISTS search_index (
-                            id SERIAL PRIMARY KEY,
-                            kod_sukl VARCHAR(20) REFERENCES leciva(kod_sukl),
-                            klicove_slovo VARCHAR(100),
-                            typ_informace VARCHAR(50),
-                            relevance INTEGER DEFAULT 1,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        )
-                    """)
-                    logger.info("Tabulka search_index vytvořena")
-                    
-                    conn.commit()
-                    logger.info("Tabulky pro extrakci inicializovány")
-                    
-        except Exception as e:
-            logger.error(f"Chyba při inicializaci tabulek pro extrakci: {e}")
-            raise
-    
-    def save_extracted_info(self, kod_sukl: str, extracted_info: Dict[str, Any], 
-                          extracted_text: str) -> bool:
-        """Uloží extrahované informace do databáze"""
-        try:
-            with pg8000.connect(**self.connection_params) as conn:
-                with conn.cursor() as cursor:
-                    
-                    cursor.execute("""
-                        INSERT INTO extracted_info (
-                            kod_sukl, indikace, davkovani, extracted_text
-                        ) VALUES (%s, %s, %s, %s)
-                        ON CONFLICT (kod_sukl) DO UPDATE SET
-                            indikace = EXCLUDED.indikace,
-                            davkovani = EXCLUDED.davkovani,
-                            extracted_text = EXCLUDED.extracted_text
-                    """, (
-                        kod_sukl,
-                        extracted_info.get('indikace', []),
-                        extracted_info.get('davkovani', []),
-                        extracted_text[:1000]  # Omezíme délku uloženého textu
-                    ))
-                    
-                    conn.commit()
-                    return True
-                    
-        except Exception as e:
-            logger.error(f"Chyba při ukládání extrahovaných informací pro {kod_sukl}: {e}")
-            return False
-    
-
-
 def main():
     """Hlavní funkce pro extrakci informací z PDF pomocí OpenAI API"""
     logger.info("🚀 Začínám extrakci informací z PDF dokumentů pomocí OpenAI API")
     
     # Inicializace
     extractor = PDFExtractor(OPENAI_API_KEY)
-    db_manager = DatabaseManager()
+    db_manager = ExtractionDatabase(OPENAI_MODEL, PROMPT_VERSION)
     
     # Načtení dokumentů z databáze
     try:
-        logger.info("Připojuji k databázi pro načtení dokumentů...")
-        with pg8000.connect(**db_manager.connection_params) as conn:
-            logger.info("Připojení úspěšné, spouštím dotaz...")
-            with conn.cursor() as cursor:
-                
-                # Získáme léky s dokumenty, které ještě nebyly zpracovány
-                logger.info("Spouštím SQL dotaz pro načtení léků...")
-                query = """
-                    SELECT DISTINCT l.kod_sukl, l.nazev, d.pdf_data
-                    FROM leciva l
-                    JOIN dokumenty d ON l.kod_sukl = d.kod_sukl
-                    WHERE d.typ = 'spc'
-                    AND l.kod_sukl NOT IN (
-                        SELECT kod_sukl FROM extracted_info
-                    )
-                    
-                """
-                logger.info(f"SQL dotaz: {query}")
-                cursor.execute(query)
-                
-                medicines = cursor.fetchall()
-                logger.info(f"Načteno {len(medicines)} léků k zpracování")
-                
-                for i, (kod_sukl, nazev, pdf_data) in enumerate(medicines, 1):
-                    logger.info(f"Zpracovávám {i}/{len(medicines)}: {kod_sukl} - {nazev}")
-                    
-                    try:
-                        # 1. Extrakce textu z PDF
-                        text = extractor.extract_text_from_pdf(pdf_data)
-                        if not text:
-                            logger.warning(f"Prázdný text pro {kod_sukl}")
-                            continue
-                        
-                        # 2. OpenAI API extrakce informací
-                        extracted_info = extractor.extract_medicine_info(text, kod_sukl)
-                        if not extracted_info:
-                            logger.warning(f"Prázdné extrahované informace pro {kod_sukl}")
-                            continue
-                        
-                        # 3. Uložení do databáze
-                        if db_manager.save_extracted_info(kod_sukl, extracted_info, text):
-                            logger.info(f"✅ Informace uloženy pro {kod_sukl}")
-                        else:
-                            logger.error(f"❌ Chyba při ukládání pro {kod_sukl}")
-                        
-                        # Kratší pauza pro OpenAI API (rate limiting)
-                        time.sleep(5)  # 5 sekund pauza mezi dotazy
-                        
-                    except Exception as e:
-                        logger.error(f"Chyba při zpracování {kod_sukl}: {e}")
-                        continue
-                
-
-                
+        logger.info("Načítám dokumenty z databáze...")
+        
+        # Požadavky na API běží souběžně místo pevné pauzy 5 s mezi nimi;
+        # na rate limit (429) reaguje sám klient OpenAI opakováním podle Retry-After
+        # SPC s oddíly 4.1 i 4.2 se převezmou přímo (deterministic_extract), model není potřeba
+        counts = extract_pending_medicines(extractor, db_manager, EXTRACTED_INFO_FIELDS, OPENAI_WORKERS,
+                                           deterministic_extract=deterministic_extract)
+        logger.info(f"Zpracováno {counts['saved']}/{counts['medicines']} léků ({counts['cached']} z cache)")
+        parsed_count = counts['medicines'] - counts['cached']
+        if parsed_count:
+            # Podíl PDF zpracovaných bez modelu - klesá-li, SPC přestávají odpovídat šabloně oddílů
+            logger.info(f"📑 Bez modelu zpracováno {counts['deterministic']}/{parsed_count} PDF "
+                        f"({100 * counts['deterministic'] / parsed_count:.0f} %)")
+        
     except Exception as e:
         logger.error(f"Chyba při načítání dat: {e}")
+    finally:
+        db_manager.close()
 
 if __name__ == "__main__":
     main()
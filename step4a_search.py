@@ -4,14 +4,115 @@ Krok 4a: Vyhledávání v extrahovaných informacích o lécích
 Samostatný modul pro vyhledávání v databázi
 """
 
-import pg8000
 import logging
+from db_pool import ConnectionPool
 from typing import List, Dict, Any
 
 # Nastavení logování
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Vyhledávací dotazy - připraví se na serveru jednou pro každé spojení a pak se jen spouštějí
+# (bez opakovaného parsování a plánování). Fulltext v extrahovaných informacích, název léku
+# přes trigramovou shodu; nejrelevantnější výsledky první. Slovník 'simple' neumí české tvary
+# ("bolest" nenajde "bolesti"), indikace a dávkování se proto hledají i podřetězcem (ILIKE) -
+# takové shody mají ts_rank 0 a řadí se za fulltextové
+SEARCH_STATEMENTS = {
+    # Každá větev přes vlastní index a s vlastním limitem (od nejlevnější - název je krátký),
+    # nic se tak nehodnotí nad celou množinou shod; nakonec se přeřadí nejvýše 3 × 20 léků.
+    # Větev názvu bere jen léky s extrahovanými informacemi, jinak by limit vyčerpaly léky,
+    # které výsledný JOIN stejně vyřadí; shoda v názvu má při řazení přednost
+    'search_all': """
+        SELECT l.kod_sukl, l.nazev, coalesce(ei.indikace, '{}'), coalesce(ei.davkovani, '{}')
+        FROM leciva l
+        JOIN extracted_info ei ON l.kod_sukl = ei.kod_sukl
+        WHERE ei.kod_sukl IN (
+            (SELECT l.kod_sukl FROM leciva l JOIN extracted_info e USING (kod_sukl)
+             WHERE l.nazev ILIKE :pattern LIMIT 20)
+            UNION
+            (SELECT kod_sukl FROM extracted_info
+             WHERE text_array_tsv(indikace) @@ plainto_tsquery('simple', :query)
+                OR text_array_to_text(indikace) ILIKE :pattern
+             ORDER BY ts_rank(text_array_tsv(indikace), plainto_tsquery('simple', :query)) DESC
+             LIMIT 20)
+            UNION
+            (SELECT kod_sukl FROM extracted_info
+             WHERE text_array_tsv(davkovani) @@ plainto_tsquery('simple', :query)
+                OR text_array_to_text(davkovani) ILIKE :pattern
+             ORDER BY ts_rank(text_array_tsv(davkovani), plainto_tsquery('simple', :query)) DESC
+             LIMIT 20)
+        )
+        ORDER BY (l.nazev ILIKE :pattern) DESC,
+                 ts_rank(text_array_tsv(ei.indikace) || text_array_tsv(ei.davkovani),
+                         plainto_tsquery('simple', :query)) DESC
+        LIMIT 20
+    """,
+    'search_indication': """
+        SELECT l.kod_sukl, l.nazev, coalesce(ei.indikace, '{}'), coalesce(ei.davkovani, '{}')
+        FROM leciva l
+        JOIN extracted_info ei ON l.kod_sukl = ei.kod_sukl
+        WHERE text_array_tsv(ei.indikace) @@ plainto_tsquery('simple', :query)
+           OR text_array_to_text(ei.indikace) ILIKE :pattern
+        ORDER BY ts_rank(text_array_tsv(ei.indikace), plainto_tsquery('simple', :query)) DESC
+        LIMIT 20
+    """,
+    'search_dosage': """
+        SELECT l.kod_sukl, l.nazev, coalesce(ei.indikace, '{}'), coalesce(ei.davkovani, '{}')
+        FROM leciva l
+        JOIN extracted_info ei ON l.kod_sukl = ei.kod_sukl
+        WHERE text_array_tsv(ei.davkovani) @@ plainto_tsquery('simple', :query)
+           OR text_array_to_text(ei.davkovani) ILIKE :pattern
+        ORDER BY ts_rank(text_array_tsv(ei.davkovani), plainto_tsquery('simple', :query)) DESC
+        LIMIT 20
+    """,
+    'medicine_details': """
+        SELECT l.kod_sukl, l.nazev, coalesce(ei.indikace, '{}'), coalesce(ei.davkovani, '{}'),
+               coalesce(ei.extracted_text, '')
+        FROM leciva l
+        JOIN extracted_info ei ON l.kod_sukl = ei.kod_sukl
+        WHERE l.kod_sukl = :kod_sukl
+    """,
+}
+
+# Názvy sloupců výsledků (NULL pole vrací dotazy rovnou jako prázdná)
+SEARCH_COLUMNS = ('kod_sukl', 'nazev', 'indikace', 'davkovani')
+DETAIL_COLUMNS = SEARCH_COLUMNS + ('extracted_text',)
+
+# Přetypování TEXT[]::text není IMMUTABLE, indexy i dotazy proto používají obalující funkce.
+# Bez nich nefunguje žádný vyhledávací dotaz - vytvářejí se vždy
+SEARCH_FUNCTIONS_SQL = """
+    CREATE OR REPLACE FUNCTION text_array_to_text(value TEXT[]) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE AS $$ SELECT value::text $$;
+    CREATE OR REPLACE FUNCTION text_array_tsv(value TEXT[]) RETURNS tsvector
+    LANGUAGE sql IMMUTABLE AS $$ SELECT to_tsvector('simple', coalesce(text_array_to_text(value), '')) $$
+"""
+
+# Indexy jen zrychlují - každá skupina se zkouší zvlášť a její selhání vyhledávání nezastaví.
+# Indikace a dávkování se hledají fulltextem (GIN index nad tsvector, řazení podle ts_rank),
+# podřetězce v nich i název léku trigramovými GIN indexy (vyžadují pg_trgm) - ILIKE '%...%'
+# pak nemusí procházet celou tabulku. Název léku k detailu/výsledkům se čte z krycího indexu
+SEARCH_INDEXES_SQL = (
+    ("fulltextové indexy", """
+        CREATE INDEX IF NOT EXISTS idx_ei_indikace_tsv
+            ON extracted_info USING gin (text_array_tsv(indikace));
+        CREATE INDEX IF NOT EXISTS idx_ei_davkovani_tsv
+            ON extracted_info USING gin (text_array_tsv(davkovani))
+    """),
+    ("trigramové indexy (pg_trgm)", """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS idx_leciva_nazev_trgm
+            ON leciva USING gin (nazev gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_ei_indikace_trgm
+            ON extracted_info USING gin (text_array_to_text(indikace) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_ei_davkovani_trgm
+            ON extracted_info USING gin (text_array_to_text(davkovani) gin_trgm_ops)
+    """),
+    ("krycí index léků", """
+        CREATE INDEX IF NOT EXISTS idx_leciva_kod_sukl_cover
+            ON leciva (kod_sukl) INCLUDE (nazev)
+    """),
+)
+
 class MedicineSearcher:
     """Třída pro vyhledávání léků v extrahovaných informacích"""
     
@@ -24,36 +125,54 @@ class MedicineSearcher:
             'user': user,
             'password': password
         }
+        # Připravené dotazy pro každé spojení zvlášť (prepared statement patří ke spojení a drží
+        # na něj silnou referenci) - při zavření spojení poolem se jeho dotazy zahodí
+        self.prepared = {}
+        self.pool = ConnectionPool(self.connection_params, on_close=self.forget_statements)
+        self.ensure_indexes()
+    
+    def close(self):
+        """Uzavře spojení v poolu"""
+        self.pool.close()
+    
+    def ensure_indexes(self):
+        """Vytvoří funkce pro vyhledávání a indexy, pokud ještě neexistují"""
+        # Funkce jsou povinné - bez nich by každé vyhledávání skončilo chybou
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(SEARCH_FUNCTIONS_SQL)
+                conn.commit()
+        
+        for description, sql in SEARCH_INDEXES_SQL:
+            try:
+                with self.pool.connection() as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute(sql)
+                        conn.commit()
+                        
+            except Exception as e:
+                # Bez indexu vyhledávání funguje, jen pomaleji (např. bez práva na CREATE EXTENSION)
+                logger.warning(f"Nepodařilo se vytvořit {description}: {e}")
+    
+    def forget_statements(self, conn):
+        """Zahodí připravené dotazy spojení, které pool zavírá"""
+        self.prepared.pop(conn, None)
+    
+    def run_statement(self, name: str, **params) -> List[List[Any]]:
+        """Spustí pojmenovaný dotaz ze SEARCH_STATEMENTS jako prepared statement"""
+        with self.pool.connection() as conn:
+            # Každé spojení v poolu si dotaz připraví při prvním použití
+            statements = self.prepared.setdefault(conn, {})
+            if name not in statements:
+                statements[name] = conn.prepare(SEARCH_STATEMENTS[name])
+            return statements[name].run(**params)
     
     def search_medicines(self, query: str) -> List[Dict[str, Any]]:
         """Vyhledá léky podle dotazu"""
         try:
-            with pg8000.connect(**self.connection_params) as conn:
-                with conn.cursor() as cursor:
-                    
-                    # Jednoduché vyhledávání v extrahovaných informacích
-                    cursor.execute("""
-                        SELECT DISTINCT l.kod_sukl, l.nazev, ei.indikace, ei.davkovani
-                        FROM leciva l
-                        JOIN extracted_info ei ON l.kod_sukl = ei.kod_sukl
-                        WHERE 
-                            ei.indikace::text ILIKE %s OR
-                            ei.davkovani::text ILIKE %s OR
-                            l.nazev ILIKE %s
-                        LIMIT 20
-                    """, (f'%{query}%', f'%{query}%', f'%{query}%'))
-                    
-                    results = []
-                    for row in cursor.fetchall():
-                        results.append({
-                            'kod_sukl': row[0],
-                            'nazev': row[1],
-                            'indikace': row[2] if row[2] else [],
-                            'davkovani': row[3] if row[3] else []
-                        })
-                    
-                    return results
-                    
+            rows = self.run_statement('search_all', query=query, pattern=f'%{query}%')
+            return [dict(zip(SEARCH_COLUMNS, row)) for row in rows]
+            
         except Exception as e:
             logger.error(f"Chyba při vyhledávání: {e}")
             return []
@@ -61,28 +180,9 @@ class MedicineSearcher:
     def search_by_indication(self, indication: str) -> List[Dict[str, Any]]:
         """Vyhledá léky podle konkrétní indikace"""
         try:
-            with pg8000.connect(**self.connection_params) as conn:
-                with conn.cursor() as cursor:
-                    
-                    cursor.execute("""
-                        SELECT DISTINCT l.kod_sukl, l.nazev, ei.indikace, ei.davkovani
-                        FROM leciva l
-                        JOIN extracted_info ei ON l.kod_sukl = ei.kod_sukl
-                        WHERE ei.indikace::text ILIKE %s
-                        LIMIT 20
-                    """, (f'%{indication}%',))
-                    
-                    results = []
-                    for row in cursor.fetchall():
-                        results.append({
-                            'kod_sukl': row[0],
-                            'nazev': row[1],
-                            'indikace': row[2] if row[2] else [],
-                            'davkovani': row[3] if row[3] else []
-                        })
-                    
-                    return results
-                    
+            rows = self.run_statement('search_indication', query=indication, pattern=f'%{indication}%')
+            return [dict(zip(SEARCH_COLUMNS, row)) for row in rows]
+            
         except Exception as e:
             logger.error(f"Chyba při vyhledávání podle indikace: {e}")
             return []
@@ -90,28 +190,9 @@ class MedicineSearcher:
     def search_by_dosage(self, dosage: str) -> List[Dict[str, Any]]:
         """Vyhledá léky podle dávkování"""
         try:
-            with pg8000.connect(**self.connection_params) as conn:
-                with conn.cursor() as cursor:
-                    
-                    cursor.execute("""
-                        SELECT DISTINCT l.kod_sukl, l.nazev, ei.indikace, ei.davkovani
-                        FROM leciva l
-                        JOIN extracted_info ei ON l.kod_sukl = ei.kod_sukl
-                        WHERE ei.davkovani::text ILIKE %s
-                        LIMIT 20
-                    """, (f'%{dosage}%',))
-                    
-                    results = []
-                    for row in cursor.fetchall():
-                        results.append({
-                            'kod_sukl': row[0],
-                            'nazev': row[1],
-                            'indikace': row[2] if row[2] else [],
-                            'davkovani': row[3] if row[3] else []
-                        })
-                    
-                    return results
-                    
+            rows = self.run_statement('search_dosage', query=dosage, pattern=f'%{dosage}%')
+            return [dict(zip(SEARCH_COLUMNS, row)) for row in rows]
+            
         except Exception as e:
             logger.error(f"Chyba při vyhledávání podle dávkování: {e}")
             return []
@@ -119,27 +200,11 @@ class MedicineSearcher:
     def get_medicine_details(self, kod_sukl: str) -> Dict[str, Any]:
         """Získá detailní informace o konkrétním léku"""
         try:
-            with pg8000.connect(**self.connection_params) as conn:
-                with conn.cursor() as cursor:
-                    
-                    cursor.execute("""
-                        SELECT l.kod_sukl, l.nazev, ei.indikace, ei.davkovani, ei.extracted_text
-                        FROM leciva l
-                        JOIN extracted_info ei ON l.kod_sukl = ei.kod_sukl
-                        WHERE l.kod_sukl = %s
-                    """, (kod_sukl,))
-                    
-                    row = cursor.fetchone()
-                    if row:
-                        return {
-                            'kod_sukl': row[0],
-                            'nazev': row[1],
-                            'indikace': row[2] if row[2] else [],
-                            'davkovani': row[3] if row[3] else [],
-                            'extracted_text': row[4] if row[4] else ""
-                        }
-                    else:
-                        return {}
+            rows = self.run_statement('medicine_details', kod_sukl=kod_sukl)
+            if rows:
+                return dict(zip(DETAIL_COLUMNS, rows[0]))
+            else:
+                return {}
                     
         except Exception as e:
             logger.error(f"Chyba při získávání detailů léku {kod_sukl}: {e}")
@@ -4,17 +4,94 @@ Krok 4b: Vektorové vyhledávání v extrahovaných informacích o lécích
 Používá sentence transformers pro embedding a pgvector pro similarity search
 """
 
-import pg8000
 import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
 import numpy as np
+from db_pool import ConnectionPool
 from typing import List, Dict, Any, Optional
 from sentence_transformers import SentenceTransformer
 import json
+import re
+from collections import OrderedDict
+from io import StringIO
 
 # Nastavení logování
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Názvy sloupců výsledků vyhledávání (k nim se přidává similarity)
+RESULT_COLUMNS = ('kod_sukl', 'nazev', 'indikace', 'davkovani')
+
+# Minimální verze pgvector (typ halfvec a funkce l2_normalize)
+PGVECTOR_MIN_VERSION = (0, 7, 0)
+
+# Parametry HNSW indexu a počet kandidátů prohledávaných při dotazu
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+HNSW_EF_SEARCH = 40
+# Kolikrát více kandidátů z halfvec indexu se přeřadí podle plné přesnosti
+HALFVEC_RERANK_FACTOR = 4
+
+# Embedding model a jeho kvantizovaná (int8) ONNX varianta z repozitáře modelu
+EMBEDDING_MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+EMBEDDING_ONNX_FILE = 'onnx/model_quint8_avx2.onnx'
+
+# Počet textů v jedné dávce pro embedding model
+EMBEDDING_BATCH_SIZE = 64
+# Jak dlouho (s) vlákno enkodéru čeká na další souběžné dotazy do jedné dávky
+ENCODE_BATCH_WINDOW = 0.05
+# Počet embeddingů dotazů držených v paměti
+EMBEDDING_CACHE_SIZE = 1024
+
+MEDICINE_VECTORS_UPSERT_SQL = """
+    INSERT INTO medicine_vectors (
+        kod_sukl, indikace_vector, davkovani_vector, combined_vector
+    ) VALUES (%s, %s::vector, %s::vector, %s::vector)
+    ON CONFLICT (kod_sukl) DO UPDATE SET
+        indikace_vector = EXCLUDED.indikace_vector,
+        davkovani_vector = EXCLUDED.davkovani_vector,
+        combined_vector = EXCLUDED.combined_vector
+"""
+
+# Hromadné ukládání: COPY do dočasné tabulky (jedno kolo místo INSERTu za každý lék),
+# pak jedním příkazem sloučit do medicine_vectors
+MEDICINE_VECTORS_STAGE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS medicine_vectors_stage (
+        kod_sukl VARCHAR(20),
+        indikace_vector vector(384),
+        davkovani_vector vector(384),
+        combined_vector vector(384)
+    ) ON COMMIT DELETE ROWS
+"""
+MEDICINE_VECTORS_COPY_SQL = """
+    COPY medicine_vectors_stage (kod_sukl, indikace_vector, davkovani_vector, combined_vector)
+    FROM STDIN
+"""
+MEDICINE_VECTORS_MERGE_SQL = """
+    INSERT INTO medicine_vectors (kod_sukl, indikace_vector, davkovani_vector, combined_vector)
+    SELECT kod_sukl, indikace_vector, davkovani_vector, combined_vector FROM medicine_vectors_stage
+    ON CONFLICT (kod_sukl) DO UPDATE SET
+        indikace_vector = EXCLUDED.indikace_vector,
+        davkovani_vector = EXCLUDED.davkovani_vector,
+        combined_vector = EXCLUDED.combined_vector
+"""
+
+def vector_literal(vector: np.ndarray) -> str:
+    """Textový zápis vektoru pro pgvector ('[0.1,0.2,...]')"""
+    # Nejkratší zápis float32 (přesnost sloupce vector) - zhruba poloviční objem proti float64
+    # a server parsuje přímo vektor místo pole float8[] s následným přetypováním
+    return '[' + ','.join(map(str, vector.astype(np.float32))) + ']'
+
+def medicine_texts(indikace: List[str], davkovani: List[str]) -> tuple:
+    """Sestaví texty indikací, dávkování a jejich kombinace pro embedding"""
+    indikace_text = " ".join(indikace) if indikace else ""
+    davkovani_text = " ".join(davkovani) if davkovani else ""
+    combined_text = f"{indikace_text} {davkovani_text}".strip()
+    return indikace_text, davkovani_text, combined_text
+
 class VectorSearchManager:
     """Třída pro vektorové vyhledávání v extrahovaných informacích"""
     
@@ -27,23 +104,59 @@ class VectorSearchManager:
             'user': user,
             'password': password
         }
+        self.pool = ConnectionPool(self.connection_params)
+        
+        # Model se načte až při prvním vytváření embeddingu (databázové metody ho nepotřebují)
+        self._model = None
+        self.model_lock = threading.Lock()
         
-        # Inicializace sentence transformer modelu
-        logger.info("Načítám sentence transformer model...")
-        self.model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-        logger.info("Model načten")
+        # Fronta požadavků na embedding a vlákno, které je zpracovává po dávkách
+        self.encode_queue = queue.Queue()
+        self.encode_worker = None
+        
+        # LRU cache embeddingů podle textu
+        self.embedding_cache = OrderedDict()
+        self.embedding_cache_lock = threading.Lock()
         
         self.init_vector_tables()
     
+    @property
+    def model(self) -> SentenceTransformer:
+        """Sentence transformer model, načtený při prvním použití"""
+        if self._model is None:
+            with self.model_lock:
+                if self._model is None:
+                    logger.info("Načítám sentence transformer model...")
+                    # ONNX Runtime s int8 kvantizovanými vahami - na CPU výrazně rychlejší než FP32 PyTorch
+                    self._model = SentenceTransformer(
+                        EMBEDDING_MODEL_NAME,
+                        backend='onnx',
+                        model_kwargs={'file_name': EMBEDDING_ONNX_FILE}
+                    )
+                    logger.info("Model načten")
+        return self._model
+    
+    def close(self):
+        """Uzavře spojení v poolu"""
+        self.pool.close()
+    
     def init_vector_tables(self):
         """Vytvoří tabulky pro vektorové vyhledávání"""
         try:
-            with pg8000.connect(**self.connection_params) as conn:
+            with self.pool.connection() as conn:
                 with conn.cursor() as cursor:
                     
                     # Kontrola pgvector rozšíření
                     cursor.execute("CREATE EXTENSION IF NOT EXISTS vector")
-                    logger.info("pgvector rozšíření aktivováno")
+                    # halfvec, halfvec_ip_ops a l2_normalize jsou až od pgvector 0.7.0
+                    cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+                    version = cursor.fetchone()[0]
+                    if tuple(int(part) for part in re.findall(r'\d+', version)[:3]) < PGVECTOR_MIN_VERSION:
+                        raise RuntimeError(
+                            f"pgvector {version} je příliš starý, krok 4b vyžaduje alespoň "
+                            f"{'.'.join(map(str, PGVECTOR_MIN_VERSION))} (ALTER EXTENSION vector UPDATE)"
+                        )
+                    logger.info(f"pgvector rozšíření aktivováno (verze {version})")
                     
                     # Tabulka pro vektory extrahovaných informací
                     cursor.execute("""
@@ -58,14 +171,37 @@ class VectorSearchManager:
                     """)
                     logger.info("Tabulka medicine_vectors vytvořena")
                     
-                    # Index pro rychlé vyhledávání
+                    # Poloviční přesnost pro ANN index - poloviční objem dat procházených při hledání,
+                    # plná přesnost zůstává pro přeřazení kandidátů
                     cursor.execute("""
-                        CREATE INDEX IF NOT EXISTS idx_medicine_vectors_combined 
-                        ON medicine_vectors 
-                        USING ivfflat (combined_vector vector_cosine_ops)
-                        WITH (lists = 100)
+                        ALTER TABLE medicine_vectors ADD COLUMN IF NOT EXISTS combined_vector_h halfvec(384)
+                        GENERATED ALWAYS AS (combined_vector::halfvec(384)) STORED
                     """)
-                    logger.info("Vektorový index vytvořen")
+                    
+                    # HNSW indexy pro rychlé vyhledávání (na rozdíl od ivfflat nepotřebují
+                    # trénovací data a mají lepší recall), pro obecné dotazy i příznaky.
+                    # Vektory jsou normalizované, cosine podobnost je tedy prostý skalární součin (<#>)
+                    cursor.execute("SELECT to_regclass('idx_mv_indikace_ip_hnsw') IS NULL")
+                    if cursor.fetchone()[0]:
+                        # Vektory uložené před zavedením normalizace se znormalizují jednorázově
+                        cursor.execute("""
+                            UPDATE medicine_vectors SET
+                                indikace_vector = l2_normalize(indikace_vector),
+                                davkovani_vector = l2_normalize(davkovani_vector),
+                                combined_vector = l2_normalize(combined_vector)
+                        """)
+                    for index in ('idx_medicine_vectors_combined', 'idx_mv_combined_hnsw',
+                                  'idx_mv_combined_h_hnsw', 'idx_mv_indikace_hnsw'):
+                        cursor.execute(f"DROP INDEX IF EXISTS {index}")
+                    for name, column, ops in (('combined_h', 'combined_vector_h', 'halfvec_ip_ops'),
+                                              ('indikace', 'indikace_vector', 'vector_ip_ops')):
+                        cursor.execute(f"""
+                            CREATE INDEX IF NOT EXISTS idx_mv_{name}_ip_hnsw
+                            ON medicine_vectors
+                            USING hnsw ({column} {ops})
+                            WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})
+                        """)
+                    logger.info("Vektorové indexy vytvořeny")
                     
                     conn.commit()
                     logger.info("Vektorové tabulky inicializovány")
@@ -76,48 +212,97 @@ class VectorSearchManager:
     
     def create_embeddings(self, text: str) -> np.ndarray:
         """Vytvoří embedding pro daný text"""
+        # Opakované dotazy se nepočítají znovu - průchod modelem je nejdražší část vyhledávání
+        with self.embedding_cache_lock:
+            embedding = self.embedding_cache.get(text)
+            if embedding is not None:
+                self.embedding_cache.move_to_end(text)
+                return embedding
+        
         try:
-            # Vytvoření embeddingu
-            embedding = self.model.encode(text)
-            return embedding
+            # Vytvoření embeddingu - souběžné dotazy spočítá vlákno enkodéru jedním průchodem modelem
+            future = Future()
+            self.ensure_encode_worker()
+            self.encode_queue.put((text, future))
+            embedding = future.result()
         except Exception as e:
             logger.error(f"Chyba při vytváření embeddingu: {e}")
             return np.zeros(384)  # Prázdný vektor jako fallback
+        
+        embedding.flags.writeable = False
+        with self.embedding_cache_lock:
+            self.embedding_cache[text] = embedding
+            if len(self.embedding_cache) > EMBEDDING_CACHE_SIZE:
+                self.embedding_cache.popitem(last=False)
+        return embedding
+    
+    def ensure_encode_worker(self):
+        """Spustí vlákno enkodéru při prvním požadavku na embedding"""
+        if self.encode_worker is None:
+            with self.model_lock:
+                if self.encode_worker is None:
+                    self.encode_worker = threading.Thread(
+                        target=self.encode_loop, name="embedding-encoder", daemon=True
+                    )
+                    self.encode_worker.start()
+    
+    def encode_loop(self):
+        """Sbírá požadavky na embedding po dobu ENCODE_BATCH_WINDOW a počítá je po dávkách"""
+        while True:
+            batch = [self.encode_queue.get()]
+            deadline = time.monotonic() + ENCODE_BATCH_WINDOW
+            while len(batch) < EMBEDDING_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.encode_queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            
+            try:
+                embeddings = self.model.encode(
+                    [text for text, _ in batch],
+                    batch_size=EMBEDDING_BATCH_SIZE,
+                    show_progress_bar=False,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True
+                )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
     
     def update_vectors_for_medicine(self, kod_sukl: str, indikace: List[str], davkovani: List[str]) -> bool:
         """Aktualizuje vektory pro konkrétní lék"""
         try:
             # Kombinace textů pro embedding
-            indikace_text = " ".join(indikace) if indikace else ""
-            davkovani_text = " ".join(davkovani) if davkovani else ""
-            combined_text = f"{indikace_text} {davkovani_text}".strip()
+            indikace_text, davkovani_text, combined_text = medicine_texts(indikace, davkovani)
             
             if not combined_text:
                 logger.warning(f"Prázdný text pro {kod_sukl}")
                 return False
             
-            # Vytvoření embeddingů
-            indikace_vector = self.create_embeddings(indikace_text)
-            davkovani_vector = self.create_embeddings(davkovani_text)
-            combined_vector = self.create_embeddings(combined_text)
+            # Vytvoření embeddingů (všechny tři texty jedním průchodem modelem)
+            indikace_vector, davkovani_vector, combined_vector = self.model.encode(
+                [indikace_text, davkovani_text, combined_text],
+                show_progress_bar=False,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )
             
             # Uložení do databáze
-            with pg8000.connect(**self.connection_params) as conn:
+            with self.pool.connection() as conn:
                 with conn.cursor() as cursor:
                     
-                    cursor.execute("""
-                        INSERT INTO medicine_vectors (
-                            kod_sukl, indikace_vector, davkovani_vector, combined_vector
-                        ) VALUES (%s, %s, %s, %s)
-                        ON CONFLICT (kod_sukl) DO UPDATE SET
-                            indikace_vector = EXCLUDED.indikace_vector,
-                            davkovani_vector = EXCLUDED.davkovani_vector,
-                            combined_vector = EXCLUDED.combined_vector
-                    """, (
+                    cursor.execute(MEDICINE_VECTORS_UPSERT_SQL, (
                         kod_sukl,
-                        indikace_vector.tolist(),
-                        davkovani_vector.tolist(),
-                        combined_vector.tolist()
+                        vector_literal(indikace_vector),
+                        vector_literal(davkovani_vector),
+                        vector_literal(combined_vector)
                     ))
                     
                     conn.commit()
@@ -128,41 +313,58 @@ class VectorSearchManager:
             logger.error(f"Chyba při aktualizaci vektorů pro {kod_sukl}: {e}")
             return False
     
+    def fetch_medicine_details(self, cursor, matches: List[tuple]) -> List[Dict[str, Any]]:
+        """Doplní k nalezeným lékům (kod_sukl, similarity) název, indikace a dávkování"""
+        if not matches:
+            return []
+        
+        # Pole indikací a dávkování se načítají až pro výsledné léky, ne pro každého kandidáta
+        cursor.execute("""
+            SELECT l.kod_sukl, l.nazev, coalesce(ei.indikace, '{}'), coalesce(ei.davkovani, '{}')
+            FROM leciva l
+            JOIN extracted_info ei ON l.kod_sukl = ei.kod_sukl
+            WHERE l.kod_sukl = ANY(%s)
+        """, ([kod_sukl for kod_sukl, _ in matches],))
+        details = {row[0]: row for row in cursor.fetchall()}
+        
+        return [
+            dict(zip(RESULT_COLUMNS, details[kod_sukl]), similarity=round(float(similarity), 3))
+            for kod_sukl, similarity in matches
+            if kod_sukl in details
+        ]
+    
     def search_similar_medicines(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Vyhledá léky podobné dotazu pomocí vektorového vyhledávání"""
         try:
             # Vytvoření embeddingu pro dotaz
             query_vector = self.create_embeddings(query)
             
-            with pg8000.connect(**self.connection_params) as conn:
+            with self.pool.connection() as conn:
                 with conn.cursor() as cursor:
                     
-                    # Vektorové vyhledávání s cosine similarity
+                    # Kandidáti z HNSW indexu nad halfvec, přeřazení podle plné přesnosti
+                    # (normalizované vektory - skalární součin je rovnou cosine similarity);
+                    # vyhledávání pracuje jen s klíči a vektory, detaily se načtou zvlášť.
+                    # HNSW vrátí nejvýše ef_search kandidátů - musí pokrýt celý limit pro přeřazení
+                    candidates = limit * HALFVEC_RERANK_FACTOR
+                    cursor.execute(f"SET LOCAL hnsw.ef_search = {max(HNSW_EF_SEARCH, candidates)}")
                     cursor.execute("""
-                        SELECT l.kod_sukl, l.nazev, ei.indikace, ei.davkovani,
-                               1 - (mv.combined_vector <=> %s) as similarity
-                        FROM leciva l
-                        JOIN extracted_info ei ON l.kod_sukl = ei.kod_sukl
-                        JOIN medicine_vectors mv ON l.kod_sukl = mv.kod_sukl
-                        ORDER BY mv.combined_vector <=> %s
+                        SELECT kod_sukl, -(combined_vector <#> %s::vector) as similarity
+                        FROM (
+                            SELECT kod_sukl, combined_vector FROM medicine_vectors
+                            ORDER BY combined_vector_h <#> %s::halfvec
+                            LIMIT %s
+                        ) mv
+                        ORDER BY similarity DESC
                         LIMIT %s
                     """, (
-                        query_vector.tolist(),
-                        query_vector.tolist(),
+                        vector_literal(query_vector),
+                        vector_literal(query_vector),
+                        candidates,
                         limit
                     ))
                     
-                    results = []
-                    for row in cursor.fetchall():
-                        results.append({
-                            'kod_sukl': row[0],
-                            'nazev': row[1],
-                            'indikace': row[2] if row[2] else [],
-                            'davkovani': row[3] if row[3] else [],
-                            'similarity': round(float(row[4]), 3)
-                        })
-                    
-                    return results
+                    return self.fetch_medicine_details(cursor, cursor.fetchall())
                     
         except Exception as e:
             logger.error(f"Chyba při vektorovém vyhledávání: {e}")
@@ -174,35 +376,24 @@ class VectorSearchManager:
             # Vytvoření embeddingu pro příznaky
             symptoms_vector = self.create_embeddings(symptoms)
             
-            with pg8000.connect(**self.connection_params) as conn:
+            with self.pool.connection() as conn:
                 with conn.cursor() as cursor:
                     
-                    # Vyhledávání v indikacích
+                    # Vyhledávání v indikacích (skalární součin normalizovaných vektorů)
+                    cursor.execute(f"SET LOCAL hnsw.ef_search = {HNSW_EF_SEARCH}")
+                    # Vzdálenost jen jednou - ORDER BY odkazuje na sloupec výsledku (index se použije)
                     cursor.execute("""
-                        SELECT l.kod_sukl, l.nazev, ei.indikace, ei.davkovani,
-                               1 - (mv.indikace_vector <=> %s) as similarity
-                        FROM leciva l
-                        JOIN extracted_info ei ON l.kod_sukl = ei.kod_sukl
-                        JOIN medicine_vectors mv ON l.kod_sukl = mv.kod_sukl
-                        ORDER BY mv.indikace_vector <=> %s
+                        SELECT kod_sukl, indikace_vector <#> %s::vector AS distance
+                        FROM medicine_vectors
+                        ORDER BY distance
                         LIMIT %s
                     """, (
-                        symptoms_vector.tolist(),
-                        symptoms_vector.tolist(),
+                        vector_literal(symptoms_vector),
                         limit
                     ))
                     
-                    results = []
-                    for row in cursor.fetchall():
-                        results.append({
-                            'kod_sukl': row[0],
-                            'nazev': row[1],
-                            'indikace': row[2] if row[2] else [],
-                            'davkovani': row[3] if row[3] else [],
-                            'similarity': round(float(row[4]), 3)
-                        })
-                    
-                    return results
+                    matches = [(kod_sukl, -distance) for kod_sukl, distance in cursor.fetchall()]
+                    return self.fetch_medicine_details(cursor, matches)
                     
         except Exception as e:
             logger.error(f"Chyba při vyhledávání podle příznaků: {e}")
@@ -213,7 +404,7 @@ class VectorSearchManager:
         try:
             updated_count = 0
             
-            with pg8000.connect(**self.connection_params) as conn:
+            with self.pool.connection() as conn:
                 with conn.cursor() as cursor:
                     
                     # Získání všech léků s extrahovanými informacemi
@@ -227,13 +418,42 @@ class VectorSearchManager:
                     medicines = cursor.fetchall()
                     logger.info(f"Načteno {len(medicines)} léků k aktualizaci vektorů")
                     
+                    rows = []
                     for kod_sukl, indikace, davkovani in medicines:
-                        if self.update_vectors_for_medicine(kod_sukl, indikace, davkovani):
-                            updated_count += 1
+                        texts = medicine_texts(indikace, davkovani)
+                        if not texts[2]:
+                            logger.warning(f"Prázdný text pro {kod_sukl}")
+                            continue
+                        rows.append((kod_sukl,) + texts)
+                    
+                    if rows:
+                        # Všechny texty jedním voláním modelu - po dávkách je výpočet mnohem efektivnější
+                        count = len(rows)
+                        texts = [row[1] for row in rows] + [row[2] for row in rows] + [row[3] for row in rows]
+                        embeddings = self.model.encode(
+                            texts,
+                            batch_size=EMBEDDING_BATCH_SIZE,
+                            show_progress_bar=False,
+                            convert_to_numpy=True,
+                            normalize_embeddings=True
+                        )
+                        
+                        # Všechny vektory jedním COPY a jedním sloučením v jedné transakci
+                        copy_data = StringIO()
+                        for i, row in enumerate(rows):
+                            copy_data.write('\t'.join((
+                                row[0],
+                                vector_literal(embeddings[i]),
+                                vector_literal(embeddings[count + i]),
+                                vector_literal(embeddings[2 * count + i])
+                            )) + '\n')
+                        copy_data.seek(0)
                         
-                        # Pauza mezi zpracováním
-                        if updated_count % 10 == 0:
-                            logger.info(f"Aktualizováno {updated_count}/{len(medicines)} vektorů")
+                        cursor.execute(MEDICINE_VECTORS_STAGE_SQL)
+                        cursor.execute(MEDICINE_VECTORS_COPY_SQL, stream=copy_data)
+                        cursor.execute(MEDICINE_VECTORS_MERGE_SQL)
+                        conn.commit()
+                        updated_count = count
             
             logger.info(f"✅ Hromadná aktualizace dokončena: {updated_count} vektorů")
             return updated_count
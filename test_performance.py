@@ -4,9 +4,13 @@ Test výkonu různých Ollama modelů
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import psutil
 import os
+import json
+
+OLLAMA_GENERATE_URL = "http://localhost:11434/api/generate"
 
 def get_system_info():
     """Získá informace o systému"""
@@ -27,60 +31,121 @@ def get_system_info():
         'gpu_available': gpu_available
     }
 
-def test_model_performance(model_name, prompt="Napiš krátkou básničku o umělé inteligenci."):
+def ollama_rss_gb():
+    """Součet RSS procesů Ollama (server i runner s načteným modelem) v GB, None pokud neběží lokálně"""
+    rss = 0
+    found = False
+    for process in psutil.process_iter(['name', 'memory_info']):
+        name = process.info['name'] or ''
+        if name.startswith('ollama') and process.info['memory_info']:
+            rss += process.info['memory_info'].rss
+            found = True
+    return rss / (1024**3) if found else None
+
+def memory_snapshot():
+    """Paměť Ollama procesů (nebo celého systému, pokud je nevidíme) a velikost page cache v GB"""
+    memory = psutil.virtual_memory()
+    rss = ollama_rss_gb()
+    used = rss if rss is not None else memory.used / (1024**3)
+    return used, getattr(memory, 'cached', 0) / (1024**3)
+
+def warmup_model(model_name, session):
+    """Načte model do paměti krátkým dotazem, aby se načítání nezapočítalo do měření"""
+    response = session.post(
+        OLLAMA_GENERATE_URL,
+        json={
+            "model": model_name,
+            "prompt": "Ahoj",
+            "stream": False,
+            "options": {"num_predict": 1}
+        },
+        timeout=300  # načtení velkého modelu může trvat déle
+    )
+    response.raise_for_status()
+
+def test_model_performance(model_name, session, prompt="Napiš krátkou básničku o umělé inteligenci."):
     """Otestuje výkon modelu"""
     print(f"\n🧪 Testuji model: {model_name}")
     print("-" * 40)
     
-    # Měření paměti před
-    memory_before = psutil.virtual_memory().used / (1024**3)
-    
-    # Měření času
-    start_time = time.time()
+    # Měření paměti před - RSS procesů Ollama, ne celého systému (ostatní procesy by měření zkreslily)
+    memory_before, cache_before = memory_snapshot()
     
     try:
-        response = requests.post(
-            "http://localhost:11434/api/generate",
+        # Zahřátí - měří se jen generování, ne načtení modelu z disku
+        warmup_start = time.time()
+        warmup_model(model_name, session)
+        print(f"🔥 Model načten za {time.time() - warmup_start:.2f} sekund")
+        
+        # Paměť po načtení modelu (page cache zvlášť - soubory modelu se do ní načítají také)
+        memory_after, cache_after = memory_snapshot()
+        memory_used = memory_after - memory_before
+        cache_used = cache_after - cache_before
+        
+        # Měření času
+        start_time = time.time()
+        
+        # Streamovaná odpověď - poslední část obsahuje počty tokenů a časy (ns) z llama.cpp
+        # Blok with uzavře spojení i při chybové odpovědi, jejíž tělo se nečte
+        with session.post(
+            OLLAMA_GENERATE_URL,
             json={
                 "model": model_name,
                 "prompt": prompt,
-                "stream": False
+                "stream": True
             },
+            stream=True,
             timeout=120  # 2 minuty timeout
-        )
+        ) as response:
+            if response.status_code != 200:
+                print(f"❌ Chyba: {response.status_code}")
+                return {'success': False}
+            
+            parts = []
+            stats = {}
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                parts.append(chunk.get('response', ''))
+                if chunk.get('done'):
+                    stats = chunk
         
         end_time = time.time()
         duration = end_time - start_time
         
-        # Měření paměti po
-        memory_after = psutil.virtual_memory().used / (1024**3)
-        memory_used = memory_after - memory_before
+        response_text = ''.join(parts)
+        response_length = len(response_text)
+        
+        # Generování (decode) a zpracování promptu (prefill) zvlášť, v tokenech
+        eval_count = stats.get('eval_count', 0)
+        eval_seconds = stats.get('eval_duration', 0) / 1e9
+        prompt_eval_count = stats.get('prompt_eval_count', 0)
+        prompt_eval_seconds = stats.get('prompt_eval_duration', 0) / 1e9
+        tokens_per_sec = eval_count / eval_seconds if eval_seconds else 0
+        prompt_tokens_per_sec = prompt_eval_count / prompt_eval_seconds if prompt_eval_seconds else 0
+        
+        print(f"✅ Úspěch!")
+        print(f"⏱️  Čas: {duration:.2f} sekund")
+        print(f"💾 Paměť: +{memory_used:.1f} GB (page cache: {cache_used:+.1f} GB)")
+        print(f"📝 Délka odpovědi: {response_length} znaků, {eval_count} tokenů")
+        print(f"🚀 Rychlost generování: {tokens_per_sec:.1f} tokenů/sekundu")
+        print(f"📥 Zpracování promptu: {prompt_eval_count} tokenů za {prompt_eval_seconds:.2f} s "
+              f"({prompt_tokens_per_sec:.0f} tokenů/sekundu)")
+        
+        # Ukázka odpovědi
+        preview = response_text[:100] + "..." if len(response_text) > 100 else response_text
+        print(f"📄 Ukázka: {preview}")
+        
+        return {
+            'success': True,
+            'duration': duration,
+            'memory_used': memory_used,
+            'response_length': response_length,
+            'tokens_per_sec': tokens_per_sec,
+            'prompt_tokens_per_sec': prompt_tokens_per_sec
+        }
         
-        if response.status_code == 200:
-            data = response.json()
-            response_text = data.get('response', '')
-            response_length = len(response_text)
-            
-            print(f"✅ Úspěch!")
-            print(f"⏱️  Čas: {duration:.2f} sekund")
-            print(f"💾 Paměť: +{memory_used:.1f} GB")
-            print(f"📝 Délka odpovědi: {response_length} znaků")
-            print(f"🚀 Rychlost: {response_length/duration:.0f} znaků/sekundu")
-            
-            # Ukázka odpovědi
-            preview = response_text[:100] + "..." if len(response_text) > 100 else response_text
-            print(f"📄 Ukázka: {preview}")
-            
-            return {
-                'success': True,
-                'duration': duration,
-                'memory_used': memory_used,
-                'response_length': response_length
-            }
-        else:
-            print(f"❌ Chyba: {response.status_code}")
-            return {'success': False}
-            
     except requests.exceptions.Timeout:
         print("❌ Timeout - model je příliš pomalý")
         return {'success': False, 'timeout': True}
@@ -97,6 +162,8 @@ def main():
     print(f"💻 CPU: {system['cpu_cores']} jader")
     print(f"💾 RAM: {system['memory_gb']} GB")
     print(f"🎮 GPU: {'Dostupné' if system['gpu_available'] else 'Nedostupné'}")
+    if ollama_rss_gb() is None:
+        print("⚠️  Proces Ollama není vidět (např. běží v Dockeru) - paměť se měří za celý systém")
     
     # Doporučení podle systému
     if system['memory_gb'] < 8:
@@ -114,8 +181,12 @@ def main():
     
     results = {}
     
+    # Jedno spojení na Ollama pro všechny testy (HTTP keep-alive)
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+    
     for model in recommended_models:
-        result = test_model_performance(model)
+        result = test_model_performance(model, session)
         results[model] = result
         
         if not result.get('success'):
@@ -131,11 +202,12 @@ def main():
         print("✅ Funkční modely:")
         for model in successful_models:
             result = results[model]
-            print(f"   {model}: {result['duration']:.1f}s, +{result['memory_used']:.1f}GB RAM")
+            print(f"   {model}: {result['duration']:.1f}s, {result['tokens_per_sec']:.1f} tok/s, "
+                  f"+{result['memory_used']:.1f}GB RAM")
         
-        # Nejlepší model
-        best_model = min(successful_models, 
-                        key=lambda m: results[m]['duration'])
+        # Nejlepší model - nejrychlejší generování tokenů (nezávisí na délce odpovědi)
+        best_model = max(successful_models, 
+                        key=lambda m: results[m]['tokens_per_sec'])
         print(f"\n🏆 Doporučený model: {best_model}")
     else:
         print("❌ Žádný model nefunguje")
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test hromadného načtení dokumentů v kroku 2 (bez databáze - spojení zaznamenává příkazy)
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from step2_sukl_api import (DatabaseManager, DOCUMENT_BULK_MERGE_SQL, DOCUMENT_CONSTRAINTS,
+                            DOCUMENT_COPY_SQL, DOCUMENT_EXECUTE_SQL)
+
+class RecordingCursor:
+    """Kurzor, který si pamatuje provedené příkazy a vrací názvy existujících omezení"""
+    
+    def __init__(self, conn):
+        self.conn = conn
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+    
+    def execute(self, sql, params=None, stream=None):
+        statement = " ".join(sql.split())
+        self.conn.statements.append(statement)
+        if stream is not None:
+            self.conn.copied = stream.read()
+        if statement.startswith("ALTER TABLE dokumenty DROP CONSTRAINT"):
+            self.conn.constraints.discard(statement.split()[-1])
+        elif statement.startswith("ALTER TABLE dokumenty ADD CONSTRAINT"):
+            self.conn.constraints.add(statement.split()[5])
+    
+    def fetchall(self):
+        return [(name,) for name in sorted(self.conn.constraints)]
+
+class RecordingConnection:
+    """Náhrada pg8000 spojení pro DatabaseManager"""
+    
+    def __init__(self, constraints):
+        self.constraints = set(constraints)
+        self.statements = []
+        self.copied = None
+        self.commits = 0
+        self.rollbacks = 0
+    
+    def cursor(self):
+        return RecordingCursor(self)
+    
+    def commit(self):
+        self.commits += 1
+    
+    def rollback(self):
+        self.rollbacks += 1
+
+def make_manager(constraints) -> DatabaseManager:
+    """DatabaseManager nad zaznamenávajícím spojením (bez připojení a migrací)"""
+    db_manager = DatabaseManager.__new__(DatabaseManager)
+    db_manager.conn = RecordingConnection(constraints)
+    db_manager.bulk_load = False
+    db_manager.document_versions = {}
+    return db_manager
+
+class DocumentBulkLoadTest(unittest.TestCase):
+    
+    def test_restore_adds_only_missing_constraints(self):
+        db_manager = make_manager(['dokumenty_pkey', 'dokumenty_kod_sukl_dokument_id_key'])
+        db_manager.restore_document_constraints()
+        
+        added = [s for s in db_manager.conn.statements if 'ADD CONSTRAINT' in s]
+        self.assertEqual(added, [
+            "ALTER TABLE dokumenty ADD CONSTRAINT dokumenty_kod_sukl_fkey "
+            "FOREIGN KEY (kod_sukl) REFERENCES leciva(kod_sukl)"
+        ])
+    
+    def test_restore_without_missing_constraints_changes_nothing(self):
+        db_manager = make_manager(name for name, _ in DOCUMENT_CONSTRAINTS)
+        db_manager.restore_document_constraints()
+        
+        self.assertFalse([s for s in db_manager.conn.statements if s.startswith('ALTER')])
+        self.assertFalse(db_manager.bulk_load)
+    
+    def test_bulk_load_merges_without_on_conflict_and_restores_constraints(self):
+        db_manager = make_manager(['dokumenty_pkey', *(name for name, _ in DOCUMENT_CONSTRAINTS)])
+        db_manager.drop_document_constraints()
+        self.assertTrue(db_manager.bulk_load)
+        self.assertEqual(db_manager.conn.constraints, {'dokumenty_pkey'})
+        
+        saved = db_manager.save_documents_batch([('0001', {'id': 1, 'nazev': 'SPC'}, b'%PDF-1.4')])
+        self.assertEqual(saved, 1)
+        statements = db_manager.conn.statements
+        self.assertIn(" ".join(DOCUMENT_COPY_SQL.split()), statements)
+        self.assertIn(" ".join(DOCUMENT_BULK_MERGE_SQL.split()), statements)
+        self.assertNotIn(DOCUMENT_EXECUTE_SQL, statements)
+        self.assertTrue(db_manager.conn.copied.startswith(b"PGCOPY\n"))
+        
+        db_manager.restore_document_constraints()
+        self.assertFalse(db_manager.bulk_load)
+        self.assertEqual(db_manager.conn.constraints,
+                         {'dokumenty_pkey', *(name for name, _ in DOCUMENT_CONSTRAINTS)})
+        # Unikátní index vzniká před cizím klíčem
+        added = [s.split()[5] for s in statements if 'ADD CONSTRAINT' in s]
+        self.assertEqual(added, [name for name, _ in DOCUMENT_CONSTRAINTS])
+
+if __name__ == "__main__":
+    unittest.main()